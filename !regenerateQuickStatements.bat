@@ -15,45 +15,14 @@ if %errorlevel%==0 (
     set PYTHON=python
 )
 
-echo [1/4] Generating Toki Pona labels...
-%PYTHON% fetch_shrines_tokiponize.py
+echo Running all pipelines (tok, ko, zh, id proposals, multilang)...
+%PYTHON% -m shrine_labels run
 if errorlevel 1 (
     echo.
-    echo ERROR: Toki Pona pipeline failed.
+    echo ERROR: One or more pipelines failed. See the summary above.
     pause
     exit /b 1
 )
-echo.
-
-echo [2/4] Generating Korean labels...
-%PYTHON% generate_korean_quickstatements.py
-if errorlevel 1 (
-    echo.
-    echo ERROR: Korean pipeline failed.
-    pause
-    exit /b 1
-)
-echo.
-
-echo [3/4] Generating Chinese labels...
-%PYTHON% generate_chinese_quickstatements.py
-if errorlevel 1 (
-    echo.
-    echo ERROR: Chinese pipeline failed.
-    pause
-    exit /b 1
-)
-echo.
-
-echo [4/4] Generating tr/de/nl/es/it/eu/lt/ru/uk/fa/ar labels...
-%PYTHON% generate_multilang_quickstatements.py
-if errorlevel 1 (
-    echo.
-    echo ERROR: Multilang pipeline failed.
-    pause
-    exit /b 1
-)
-
 echo.
 echo ==========================================
 echo  All pipelines complete!
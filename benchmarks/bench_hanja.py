@@ -0,0 +1,105 @@
+"""
+Benchmark the Korean hanja path on the Japanese-label fallback corpus.
+Run from the repo root: python benchmarks/bench_hanja.py
+
+The corpus is every Japanese source label in quickstatements/ko.txt (or, if
+that file is absent, the identical label population in zh.txt). Compares the
+segmented, memoized japanese_to_korean_hanja() against the original
+per-character walk and checks both produce the same labels. The reading
+dictionary is switched off: it changes labels on purpose.
+"""
+
+import os
+import re
+import sys
+import time
+from functools import partial
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QS_DIR    = os.path.join(REPO_ROOT, "quickstatements")
+sys.path.insert(0, REPO_ROOT)
+
+import hanja
+from koreanizer import koreanize
+import generate_korean_quickstatements as ko
+from reading_dictionary import lookup_reading
+
+# No reading dictionary, so runs are only translated through hanja
+ko.lookup_reading = partial(lookup_reading, path=os.path.join(REPO_ROOT, "no_reading_dictionary.tsv"))
+
+SOURCE_RE = re.compile(r'^# Source: JA "(.*)"')
+
+
+def load_corpus():
+    for name in ("ko.txt", "zh.txt"):
+        path = os.path.join(QS_DIR, name)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                labels = [m.group(1) for m in map(SOURCE_RE.match, f) if m]
+            return name, labels
+    sys.exit("No quickstatements/ko.txt or zh.txt to read Japanese labels from.")
+
+
+def reference_hanja(ja_label):
+    """The original implementation: per-character range checks, one
+    hanja.translate per kanji run, then a rescan for untranslated CJK."""
+    if not ja_label:
+        return None
+    result_parts, current_kana, current_kanji = [], [], []
+    for char in ja_label:
+        if '\u3040' <= char <= '\u309F' or '\u30A0' <= char <= '\u30FF':
+            if current_kanji:
+                result_parts.append(hanja.translate("".join(current_kanji), "substitution"))
+                current_kanji = []
+            current_kana.append(char)
+        elif '\u4E00' <= char <= '\u9FFF' or '\u3400' <= char <= '\u4DBF':
+            if current_kana:
+                result_parts.append(koreanize("".join(current_kana)))
+                current_kana = []
+            current_kanji.append(char)
+        else:
+            if current_kanji:
+                result_parts.append(hanja.translate("".join(current_kanji), "substitution"))
+                current_kanji = []
+            if current_kana:
+                result_parts.append(koreanize("".join(current_kana)))
+                current_kana = []
+    if current_kanji:
+        result_parts.append(hanja.translate("".join(current_kanji), "substitution"))
+    if current_kana:
+        result_parts.append(koreanize("".join(current_kana)))
+    result = "".join(result_parts)
+    if any('\u4E00' <= c <= '\u9FFF' or '\u3400' <= c <= '\u4DBF' for c in result):
+        return None
+    return result if result else None
+
+
+def timed(func, labels):
+    start = time.perf_counter()
+    results = [func(label) for label in labels]
+    return time.perf_counter() - start, results
+
+
+def main():
+    source, labels = load_corpus()
+    print(f"Corpus: {len(labels):,} Japanese labels from quickstatements/{source}")
+
+    # Warm hanja's lazy dictionary load so neither side pays for it
+    hanja.translate("神社", "substitution")
+
+    ref_time, ref_results = timed(reference_hanja, labels)
+    cold_time, results = timed(ko.japanese_to_korean_hanja, labels)
+    warm_time, _ = timed(ko.japanese_to_korean_hanja, labels)
+
+    mismatches = sum(1 for a, b in zip(ref_results, results) if a != b)
+    runs = ko._hanja_run.cache_info()
+    print(f"  reference (per-character walk): {ref_time:8.3f}s")
+    print(f"  segmented + memoized (cold):    {cold_time:8.3f}s  ({ref_time / cold_time:.1f}x)")
+    print(f"  segmented + memoized (warm):    {warm_time:8.3f}s  ({ref_time / warm_time:.1f}x)")
+    print(f"  distinct kanji runs translated: {runs.misses:,} (cache hits: {runs.hits:,})")
+    print(f"  mismatches vs reference:        {mismatches}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""
+Benchmark the Indonesian proposals romanizer.
+Run from the repo root: python benchmarks/bench_romaji.py
+
+The corpus is every Japanese source label in quickstatements/zh.txt (or
+ko.txt), plus a hiragana reading of each one standing in for the P1814/P5461
+values. Compares to_romaji() — kana fast path and memoized pykakasi — against
+a plain pykakasi conversion of every text, and checks both give the same names.
+The reading dictionary is switched off: it changes names on purpose.
+"""
+
+import os
+import re
+import sys
+import time
+from functools import partial
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QS_DIR    = os.path.join(REPO_ROOT, "quickstatements")
+sys.path.insert(0, REPO_ROOT)
+
+import generate_indonesian_proposals as proposals
+from reading_dictionary import segment_readings
+
+# No reading dictionary, so to_romaji() only takes the kana and pykakasi paths
+proposals.segment_readings = partial(segment_readings, path=os.path.join(REPO_ROOT, "no_reading_dictionary.tsv"))
+
+SOURCE_RE = re.compile(r'^# Source: JA "(.*)"')
+
+
+def load_corpus():
+    for name in ("zh.txt", "ko.txt"):
+        path = os.path.join(QS_DIR, name)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                labels = [m.group(1) for m in map(SOURCE_RE.match, f) if m]
+            return name, labels
+    sys.exit("No quickstatements/zh.txt or ko.txt to read Japanese labels from.")
+
+
+def reference_romaji(text, kks):
+    """The original to_romaji(): one uncached pykakasi conversion per text."""
+    cleaned = re.sub(r'\(.*?\)|（.*?）', '', text).strip()
+    words = [item['hepburn'] for item in kks.convert(cleaned)]
+    return proposals.romaji_name(words)
+
+
+def timed(func, texts):
+    start = time.perf_counter()
+    results = [func(text) for text in texts]
+    return time.perf_counter() - start, results
+
+
+def main():
+    source, labels = load_corpus()
+    kks = proposals.get_kks()
+    readings = ["".join(item['hira'] for item in kks.convert(label)) for label in labels]
+    print(f"Corpus: {len(labels):,} Japanese labels from quickstatements/{source}, plus a kana reading of each")
+
+    mismatches = 0
+    for name, texts in (("labels", labels), ("kana readings", readings)):
+        ref_time, ref_results = timed(lambda text: reference_romaji(text, kks), texts)
+        new_time, results = timed(proposals.to_romaji, texts)
+        mismatches += sum(1 for a, b in zip(ref_results, results) if a != b)
+        print(f"  {name + ':':15s} pykakasi {ref_time:7.3f}s   to_romaji {new_time:7.3f}s  ({ref_time / new_time:.1f}x)")
+
+    fast = sum(1 for text in readings if proposals.kana_to_hepburn_words(text) is not None)
+    print(f"  readings on the kana fast path: {fast:,} / {len(readings):,}")
+    print(f"  mismatches vs pykakasi:         {mismatches}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
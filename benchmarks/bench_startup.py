@@ -0,0 +1,74 @@
+"""
+Startup budget for the importable converters.
+Run from the repo root: python benchmarks/bench_startup.py
+
+Imports each module in a fresh interpreter with `python -X importtime` and
+takes the best cumulative import time over a few runs. Exits non-zero if a
+module goes over its budget, or if it imports one of the heavy dependencies
+(HTTP client, pykakasi, pipeline scripts) that should only load on first use.
+"""
+
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RUNS = 5
+
+# Cumulative import time budget per module, in milliseconds
+BUDGETS_MS = {
+    "tokiponizer":                      10,
+    "koreanizer":                       15,
+    "label_parser":                      5,
+    "generate_chinese_quickstatements": 30,
+    "generate_korean_quickstatements":  50,
+    "generate_indonesian_proposals":    30,
+}
+
+# Modules none of the above may pull in at import time
+FORBIDDEN = (
+    "requests",
+    "pykakasi",
+    "concurrent.futures.process",
+    "fetch_shrines_tokiponize",
+)
+
+
+def import_profile(module):
+    """Return {imported module: cumulative µs} for one fresh import of module."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=True,
+    )
+    profile = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue  # Header line
+        profile[fields[2].strip()] = int(fields[1])
+    return profile
+
+
+def main():
+    failures = 0
+    print(f"Best of {RUNS} fresh imports (cumulative, ms):")
+    for module, budget in BUDGETS_MS.items():
+        profiles = [import_profile(module) for _ in range(RUNS)]
+        best = min(profile[module] for profile in profiles) / 1000
+        heavy = [name for name in FORBIDDEN if name in profiles[0]]
+        status = "ok"
+        if best > budget:
+            status = "OVER BUDGET"
+        if heavy:
+            status = "imports " + ", ".join(heavy)
+        if status != "ok":
+            failures += 1
+        print(f"  {module:34s} {best:7.1f} / {budget:3d}  {status}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+"""
+Build the kanji reading dictionary from shrine/temple names on Wikidata.
+
+Process:
+1. Fetch shrines and temples that have both a Japanese label and a
+   name in kana (P1814)
+2. Align each label with its reading: kana in the label anchor the match,
+   generic suffixes (神社, 大社, 寺...) are peeled off, and the remaining kanji
+   runs keep the reading between the anchors
+3. Split longer runs at compounds already learned with confidence
+   (若宮八幡 → 若宮 + 八幡)
+4. Keep multi-kanji compounds seen often enough with one clearly dominant reading
+
+Output: reading_dictionary.tsv (surface, reading, count), loaded by
+reading_dictionary.py for the Indonesian proposals and the Korean hanja path.
+"""
+
+import sys
+import io
+import re
+import argparse
+from collections import Counter, defaultdict
+from tokiponizer import katakana_to_hiragana
+from reading_dictionary import READING_DICTIONARY_PATH, write_reading_dictionary
+
+SPARQL_ENDPOINT = "https://query.wikidata.org/sparql"
+
+SPARQL_QUERY = """
+SELECT DISTINCT ?item ?jaLabel ?kanaName WHERE {
+  {
+    ?item wdt:P31/wdt:P279* wd:Q845945 .
+  }
+  UNION
+  {
+    ?item wdt:P31 wd:Q5393308 .
+    ?item wdt:P17 wd:Q17 .
+  }
+  ?item rdfs:label ?jaLabel . FILTER(LANG(?jaLabel) = "ja")
+  ?item wdt:P1814 ?kanaName .
+}
+ORDER BY ?item
+"""
+
+# Generic name endings and the readings they take in P1814, longest first.
+# Peeled off before a run is recorded so that 日枝神社 teaches 日枝→ひえ.
+GENERIC_SUFFIXES = [
+    ("天満宮", ("てんまんぐう",)),
+    ("八幡宮", ("はちまんぐう",)),
+    ("神社", ("じんじゃ", "じんしゃ")),
+    ("大社", ("たいしゃ",)),
+    ("神宮", ("じんぐう",)),
+    ("権現", ("ごんげん",)),
+    ("寺", ("じ", "でら", "てら")),
+    ("宮", ("ぐう", "みや")),
+    ("社", ("しゃ", "じゃ", "やしろ")),
+    ("院", ("いん",)),
+    ("堂", ("どう",)),
+    ("庵", ("あん",)),
+]
+
+DEFAULT_MIN_COUNT = 2
+# Single kanji take too many readings to compose names from (七 in 七宝寺 vs 七尾)
+MIN_SURFACE_LENGTH = 2
+# Share of a surface's pairs that must agree on its reading (宮 is ぐう or みや: dropped)
+DEFAULT_MIN_AGREEMENT = 0.8
+
+KANJI = "㐀-䶿一-鿿々"
+KANA = "ぁ-ゖァ-ヺー"
+LABEL_RUN_RE = re.compile(f"([{KANJI}]+)|([{KANA}]+)")
+BRACKETS_RE = re.compile(r'\(.*?\)|（.*?）')
+READING_JUNK_RE = re.compile(r"[\s・　]")
+
+
+def fetch_pairs():
+    """Fetch (ja label, kana name) pairs from Wikidata."""
+    import requests
+
+    print("Querying Wikidata for shrines/temples with a name in kana (P1814)...")
+    r = requests.get(
+        SPARQL_ENDPOINT,
+        params={"query": SPARQL_QUERY, "format": "json"},
+        headers={"User-Agent": "Japanese-Tokiponizer/1.0 (reading dictionary)"},
+        timeout=300,
+    )
+    r.raise_for_status()
+    results = r.json()["results"]["bindings"]
+    print(f"Got {len(results)} results from Wikidata.")
+    return [(b["jaLabel"]["value"], b["kanaName"]["value"]) for b in results]
+
+
+def align(ja_label, kana_name):
+    """Return [(kanji run, reading)] for one label/reading pair, or None if it doesn't align.
+
+    The label may only contain kanji and kana; its kana runs must appear
+    verbatim in the reading, and every kanji takes one to four kana. A pair
+    the pattern can align in more than one way is rejected.
+    """
+    label = BRACKETS_RE.sub("", ja_label).strip()
+    reading = katakana_to_hiragana(READING_JUNK_RE.sub("", kana_name))
+    runs = [m for m in LABEL_RUN_RE.finditer(label)]
+    if not runs or "".join(m.group() for m in runs) != label:
+        return None
+
+    kanji_runs, lazy, greedy = [], [], []
+    for m in runs:
+        kanji, kana = m.groups()
+        if kanji:
+            kanji_runs.append(kanji)
+            bounds = f"{len(kanji)},{4 * len(kanji)}"
+            lazy.append(f"(.{{{bounds}}}?)")
+            greedy.append(f"(.{{{bounds}}})")
+        else:
+            lazy.append(re.escape(katakana_to_hiragana(kana)))
+            greedy.append(lazy[-1])
+    match = re.fullmatch("".join(lazy), reading)
+    if not match or match.groups() != re.fullmatch("".join(greedy), reading).groups():
+        return None
+    return list(zip(kanji_runs, match.groups()))
+
+
+def peel_suffixes(kanji, reading):
+    """Split generic suffixes off a run: yields (surface, reading) for each part."""
+    parts = []
+    peeled = True
+    while peeled:
+        peeled = False
+        for surface, readings in GENERIC_SUFFIXES:
+            if not kanji.endswith(surface) or len(kanji) == len(surface):
+                continue
+            for suffix_reading in readings:
+                rest = len(reading) - len(suffix_reading)
+                if reading.endswith(suffix_reading) and rest >= len(kanji) - len(surface):
+                    parts.append((surface, suffix_reading))
+                    kanji, reading = kanji[:-len(surface)], reading[:rest]
+                    peeled = True
+                    break
+            if peeled:
+                break
+    parts.append((kanji, reading))
+    return parts[::-1]
+
+
+def confident(counts, min_count, min_agreement):
+    """{surface: (reading, count)} for surfaces whose dominant reading is frequent and agreed on."""
+    entries = {}
+    for surface, readings in counts.items():
+        if len(surface) < MIN_SURFACE_LENGTH:
+            continue
+        total = sum(readings.values())
+        reading, count = readings.most_common(1)[0]
+        if count >= min_count and count >= min_agreement * total:
+            entries[surface] = (reading, count)
+    return entries
+
+
+def split_run(kanji, reading, known):
+    """Split a run into known compounds wherever their readings line up.
+
+    若宮八幡/わかみやはちまん becomes 若宮 + 八幡 once both are known; parts
+    that match nothing are kept whole.
+    """
+    for size in range(len(kanji) - 1, 0, -1):
+        head, tail = kanji[:size], kanji[size:]
+        if head in known:
+            head_reading = known[head][0]
+            if reading.startswith(head_reading) and len(reading) - len(head_reading) >= len(tail):
+                return [(head, head_reading)] + split_run(tail, reading[len(head_reading):], known)
+        if tail in known:
+            tail_reading = known[tail][0]
+            if reading.endswith(tail_reading) and len(reading) - len(tail_reading) >= len(head):
+                return split_run(head, reading[:-len(tail_reading)], known) + [(tail, tail_reading)]
+    return [(kanji, reading)]
+
+
+def count_readings(runs):
+    counts = defaultdict(Counter)
+    for kanji, reading in runs:
+        counts[kanji][reading] += 1
+    return counts
+
+
+def build_entries(pairs, min_count=DEFAULT_MIN_COUNT, min_agreement=DEFAULT_MIN_AGREEMENT):
+    """Align every pair and return {surface: (reading, count)} for the dictionary."""
+    runs = []
+    for ja_label, kana_name in pairs:
+        for kanji, reading in align(ja_label, kana_name) or ():
+            runs.extend(peel_suffixes(kanji, reading))
+
+    # Second pass: recount with every run split at the compounds the first
+    # pass is confident about, so the dictionary holds reusable parts
+    known = confident(count_readings(runs), min_count, min_agreement)
+    split_runs = [part for kanji, reading in runs for part in split_run(kanji, reading, known)]
+    return confident(count_readings(split_runs), min_count, min_agreement)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build the kanji reading dictionary from P1814 kana names.")
+    parser.add_argument("--output", default=READING_DICTIONARY_PATH,
+                        help="where to write the dictionary (default: reading_dictionary.tsv)")
+    parser.add_argument("--min-count", type=int, default=DEFAULT_MIN_COUNT,
+                        help=f"pairs a compound must appear in (default: {DEFAULT_MIN_COUNT})")
+    parser.add_argument("--min-agreement", type=float, default=DEFAULT_MIN_AGREEMENT,
+                        help=f"share of those pairs that must agree on the reading (default: {DEFAULT_MIN_AGREEMENT})")
+    return parser.parse_args(argv)
+
+
+def main():
+    # Windows UTF-8 console fix
+    if hasattr(sys.stdout, 'buffer') and not isinstance(sys.stdout, io.TextIOWrapper):
+        sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    elif hasattr(sys.stdout, 'reconfigure') and sys.stdout.encoding != 'utf-8':
+        sys.stdout.reconfigure(encoding='utf-8')
+
+    args = parse_args()
+    pairs = fetch_pairs()
+    entries = build_entries(pairs, args.min_count, args.min_agreement)
+    write_reading_dictionary(entries, args.output)
+    print(f"\nDone! Wrote {len(entries)} readings to {args.output}")
+
+    print("\n--- Most common compounds ---")
+    top = sorted(entries.items(), key=lambda item: -item[1][1])[:20]
+    for surface, (reading, count) in top:
+        print(f"  {surface:8s} → {reading:12s} ({count})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""
+Columnar tables for the pipelines' intermediate outputs (no extra dependencies).
+
+shrines_tokiponized and proposed_indonesian_labels are CSV by default; with
+--format columnar the pipelines write them as .cols files instead, and the
+readers take only the columns they ask for.
+
+A .cols file is a sequence of row groups followed by a JSON footer:
+
+  COLS1\\n | column blocks of row group 1 | ... | footer JSON | footer length (8 bytes) | COLS1\\n
+
+Every column of a row group is one zlib-compressed block, typed as
+- "int": little-endian int64 values,
+- "bool": one byte per value,
+- "str": UTF-8 text, either "plain" (uint32 lengths, then the bytes) or, for
+  columns with few distinct values (source_lang, type...), "dict" (the
+  distinct strings, encoded as plain, then uint16/uint32 indices).
+The footer gives the schema and where each block is, so reading two
+columns seeks to and inflates just those blocks.
+
+Writing one format removes a table of the same name in the other format,
+so readers never pick up a stale copy; it is only removed once the new
+table has been written, so a failed run keeps the previous one.
+"""
+
+import os
+import sys
+import csv
+import json
+import zlib
+import struct
+from array import array
+from pipeline_stages import BackgroundWriter, file_digest
+
+MAGIC = b"COLS1\n"
+FORMATS = ("csv", "columnar")
+EXTENSIONS = {"csv": ".csv", "columnar": ".cols"}
+
+# Rows buffered per row group: bounds the writer's memory
+ROW_GROUP_SIZE = 65536
+COMPRESSION_LEVEL = 1
+
+_LITTLE_ENDIAN = sys.byteorder == "little"
+
+
+def add_format_argument(parser):
+    """Add the shared --format option for a pipeline's intermediate table."""
+    parser.add_argument(
+        "--format", choices=FORMATS, default="csv",
+        help="format of the intermediate table: csv, or columnar (.cols) for faster, smaller files "
+             "(default: csv)",
+    )
+
+
+def table_path(base, fmt):
+    """Path of a table in a format: base name plus .csv or .cols."""
+    return base + EXTENSIONS[fmt]
+
+
+def find_table(base):
+    """The table called base in whichever format exists (columnar first), or None."""
+    for fmt in ("columnar", "csv"):
+        path = table_path(base, fmt)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _to_bytes(values, typecode):
+    packed = array(typecode, values)
+    if not _LITTLE_ENDIAN:
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _from_bytes(data, typecode):
+    unpacked = array(typecode)
+    unpacked.frombytes(data)
+    if not _LITTLE_ENDIAN:
+        unpacked.byteswap()
+    return unpacked
+
+
+def _encode_plain(strings):
+    encoded = [s.encode("utf-8") for s in strings]
+    return _to_bytes(map(len, encoded), "I") + b"".join(encoded)
+
+
+def _decode_plain(data, count):
+    """(strings, end offset) of count plain-encoded strings at the start of data."""
+    lengths = _from_bytes(data[:4 * count], "I")
+    strings = []
+    pos = 4 * count
+    for length in lengths:
+        strings.append(data[pos:pos + length].decode("utf-8"))
+        pos += length
+    return strings, pos
+
+
+def encode_column(values, column_type):
+    """(encoding, block bytes, dictionary size) of one column's values in a row group."""
+    if column_type == "int":
+        return "int64", _to_bytes(values, "q"), None
+    if column_type == "bool":
+        return "bool", bytes(1 if v else 0 for v in values), None
+    distinct = list(dict.fromkeys(values))
+    if len(distinct) * 2 <= len(values):
+        index = {s: i for i, s in enumerate(distinct)}
+        typecode = "H" if len(distinct) <= 0xFFFF else "I"
+        return "dict", _encode_plain(distinct) + _to_bytes(map(index.__getitem__, values), typecode), len(distinct)
+    return "plain", _encode_plain(values), None
+
+
+def decode_column(data, encoding, rows, size=None):
+    if encoding == "int64":
+        return list(_from_bytes(data, "q"))
+    if encoding == "bool":
+        return [b == 1 for b in data]
+    if encoding == "dict":
+        distinct, offset = _decode_plain(data, size)
+        typecode = "H" if size <= 0xFFFF else "I"
+        return [distinct[i] for i in _from_bytes(data[offset:], typecode)]
+    return _decode_plain(data, rows)[0]
+
+
+def _coerce(values, column_type):
+    """A column's values as its type (rows may give CSV-style strings)."""
+    if column_type == "int":
+        return [int(v) for v in values]
+    if column_type == "bool":
+        return [v if isinstance(v, bool) else v == "True" for v in values]
+    return [v if type(v) is str else "" if v is None else str(v) for v in values]
+
+
+class ColumnarWriter:
+    """Writes rows (dicts) to a .cols file, a row group at a time.
+
+    Like BackgroundWriter, the file is written under a temporary name and
+    replaces path on a normal close only if its content changed. The files
+    in obsolete are removed after that.
+    """
+
+    def __init__(self, path, columns, row_group_size=ROW_GROUP_SIZE, obsolete=()):
+        self.path = path
+        self.obsolete = list(obsolete)
+        self.tmp_path = path + ".tmp"
+        self.columns = list(columns)  # [(name, type)]
+        self.row_group_size = row_group_size
+        self.row_groups = []
+        self.changed = None
+        self._buffer = {name: [] for name, _ in self.columns}
+        self._appends = [(name, self._buffer[name].append) for name, _ in self.columns]
+        self._rows = 0
+        self._file = open(self.tmp_path, "wb")
+        self._file.write(MAGIC)
+
+    def writerow(self, row):
+        for name, append in self._appends:
+            append(row.get(name, ""))
+        self._rows += 1
+        if self._rows >= self.row_group_size:
+            self._flush()
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+    def _flush(self):
+        if not self._rows:
+            return
+        blocks = {}
+        for name, column_type in self.columns:
+            values = self._buffer[name]
+            encoding, data, size = encode_column(_coerce(values, column_type), column_type)
+            data = zlib.compress(data, COMPRESSION_LEVEL)
+            blocks[name] = {"offset": self._file.tell(), "length": len(data), "encoding": encoding}
+            if size is not None:
+                blocks[name]["size"] = size
+            self._file.write(data)
+            values.clear()
+        self.row_groups.append({"rows": self._rows, "blocks": blocks})
+        self._rows = 0
+
+    def close(self, discard=False):
+        try:
+            if not discard:
+                self._flush()
+                footer = json.dumps({"columns": self.columns, "row_groups": self.row_groups}).encode("utf-8")
+                self._file.write(footer + struct.pack("<Q", len(footer)) + MAGIC)
+        finally:
+            self._file.close()
+        if discard:
+            os.remove(self.tmp_path)
+            return
+        self.changed = file_digest(self.path) != file_digest(self.tmp_path)
+        if self.changed:
+            os.replace(self.tmp_path, self.path)
+        else:
+            os.remove(self.tmp_path)
+        _remove_obsolete(self.obsolete)
+
+    @property
+    def status(self):
+        return "updated" if self.changed else "unchanged"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(discard=exc_type is not None)
+
+
+class CsvTableWriter:
+    """The CSV counterpart of ColumnarWriter: a header row, then one line per row."""
+
+    def __init__(self, path, columns, encoding="utf-8", obsolete=()):
+        self.path = path
+        self.obsolete = list(obsolete)
+        self._out = BackgroundWriter(path, encoding=encoding, newline="")
+        self._writer = csv.DictWriter(self._out, fieldnames=[name for name, _ in columns])
+        self._writer.writeheader()
+
+    @property
+    def changed(self):
+        return self._out.changed
+
+    @property
+    def status(self):
+        return self._out.status
+
+    def writerow(self, row):
+        self._writer.writerow(row)
+
+    def writerows(self, rows):
+        self._writer.writerows(rows)
+
+    def close(self, discard=False):
+        self._out.close(discard=discard)
+        if not discard:
+            _remove_obsolete(self.obsolete)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(discard=exc_type is not None)
+
+
+def _remove_obsolete(paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def open_table(base, columns, fmt="csv", csv_encoding="utf-8"):
+    """Writer for the table called base in fmt; a copy in the other format is removed once it is written."""
+    path = table_path(base, fmt)
+    obsolete = [table_path(base, other) for other in FORMATS if other != fmt]
+    if fmt == "columnar":
+        return ColumnarWriter(path, columns, obsolete=obsolete)
+    return CsvTableWriter(path, columns, encoding=csv_encoding, obsolete=obsolete)
+
+
+def read_footer(f):
+    f.seek(-(8 + len(MAGIC)), os.SEEK_END)
+    tail = f.read(8 + len(MAGIC))
+    if tail[8:] != MAGIC:
+        raise ValueError(f"{getattr(f, 'name', 'file')} is not a columnar table")
+    (length,) = struct.unpack("<Q", tail[:8])
+    f.seek(-(8 + len(MAGIC) + length), os.SEEK_END)
+    return json.loads(f.read(length))
+
+
+def read_schema(path):
+    """[(name, type)] of a .cols file."""
+    with open(path, "rb") as f:
+        return [tuple(column) for column in read_footer(f)["columns"]]
+
+
+def iter_column_groups(path, columns=None):
+    """Yield {name: [values]} per row group of a .cols file, for the named columns only."""
+    with open(path, "rb") as f:
+        footer = read_footer(f)
+        names = [name for name, _ in footer["columns"]]
+        wanted = names if columns is None else list(columns)
+        missing = [name for name in wanted if name not in names]
+        if missing:
+            raise KeyError(f"{path} has no column(s) {', '.join(missing)}")
+        for group in footer["row_groups"]:
+            values = {}
+            for name in wanted:
+                block = group["blocks"][name]
+                f.seek(block["offset"])
+                data = zlib.decompress(f.read(block["length"]))
+                values[name] = decode_column(data, block["encoding"], group["rows"], block.get("size"))
+            yield values
+
+
+def read_columns(path, columns=None):
+    """{name: [values]} for the named columns (default: all) of a .cols file."""
+    result = None
+    for group in iter_column_groups(path, columns):
+        if result is None:
+            result = group
+        else:
+            for name, values in group.items():
+                result[name].extend(values)
+    if result is None:
+        return {name: [] for name in (columns or [name for name, _ in read_schema(path)])}
+    return result
+
+
+def iter_rows(path, columns=None, encoding="utf-8"):
+    """Yield rows of a .cols or .csv table as dicts of the named columns (CSV values stay strings)."""
+    if path.endswith(EXTENSIONS["csv"]):
+        with open(path, encoding=encoding, newline="") as f:
+            for row in csv.DictReader(f):
+                yield row if columns is None else {name: row[name] for name in columns}
+        return
+    for group in iter_column_groups(path, columns):
+        names = list(group)
+        for values in zip(*(group[name] for name in names)):
+            yield dict(zip(names, values))
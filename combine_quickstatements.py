@@ -0,0 +1,114 @@
+"""
+Combine the per-language QuickStatements files into one batch grouped by item.
+
+Submitted one file at a time, every language is a separate pass over the
+same items. This writes quickstatements/combined.txt, where all of an
+item's new labels follow each other:
+
+  Q1001826	Lde	"Gyokusen-ji-Tempel"
+  ...
+  Q1001826	Lru	"Храм Гёкусэндзи"
+  # Source: id "Wihara Gyokusen-ji" | EN "Gyokusen-ji Temple"
+  Q1001826	Ltok	"tomo sewi Kijokusensi"
+  ...
+
+Each language file is put in statement order with the external sort from
+statement_delta.py (bounded runs spilled to temporary files), and the sorted
+streams are combined with a k-way merge, so only one item's statements are
+held at a time. Items are in QID order, as in the delta files; comment
+lines stay above their statement, and a comment repeated by several
+languages of one item is written once.
+
+  python combine_quickstatements.py
+  python combine_quickstatements.py --langs ko,zh,ru --shard-size 5000
+"""
+
+import os
+import sys
+import io
+import heapq
+import argparse
+import tempfile
+from itertools import groupby
+from generate_multilang_quickstatements import ALL_LANGS
+from pipeline_stages import BackgroundWriter
+from statement_delta import DEFAULT_RUN_SIZE, sorted_statements, add_delta_argument, delta_callback
+from statement_shards import add_shard_argument, sharded
+
+QS_DIR = "quickstatements"
+COMBINED_NAME = "combined"
+
+# Label files submitted as they are (id_proposed.txt needs review first)
+DEFAULT_LANGS = ["tok", "ko", "zh", *ALL_LANGS]
+
+
+def statement_qid(statement):
+    return statement.split("\t", 1)[0]
+
+
+def combined_statements(paths, scratch, run_size=DEFAULT_RUN_SIZE):
+    """Yield (qid, [(statement, comments), ...]) over all the files, in QID order."""
+    streams = [sorted_statements(path, scratch, run_size) for path in paths]
+    merged = heapq.merge(*streams)
+    for qid, group in groupby(merged, key=lambda record: statement_qid(record[0])):
+        yield qid, list(group)
+
+
+def write_combined(paths, output, run_size=DEFAULT_RUN_SIZE, delta=False, shard_size=0):
+    """Write the combined file; returns (items, statements, status)."""
+    items = statements = 0
+    writer = BackgroundWriter(output, before_replace=delta_callback(delta, COMBINED_NAME))
+    with tempfile.TemporaryDirectory(prefix="combine-") as scratch, \
+            sharded(writer, COMBINED_NAME, shard_size) as f:
+        for qid, group in combined_statements(paths, scratch, run_size):
+            written_comments = set()
+            for statement, comments in group:
+                for comment in comments:
+                    if comment not in written_comments:
+                        written_comments.add(comment)
+                        f.write(comment + "\n")
+                f.write(statement + "\n")
+            items += 1
+            statements += len(group)
+    return items, statements, f.status
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Combine the per-language QuickStatements files into one batch grouped by QID.")
+    parser.add_argument(
+        "--langs", default=",".join(DEFAULT_LANGS),
+        help="comma-separated language files to combine (default: all label languages, without id_proposed)",
+    )
+    parser.add_argument("--output", default=os.path.join(QS_DIR, COMBINED_NAME + ".txt"),
+                        help="where to write the combined file (default: quickstatements/combined.txt)")
+    parser.add_argument("--run-size", type=int, default=DEFAULT_RUN_SIZE,
+                        help=f"statements sorted in memory at a time (default: {DEFAULT_RUN_SIZE})")
+    add_delta_argument(parser)
+    add_shard_argument(parser)
+    args = parser.parse_args(argv)
+    args.langs = [lang.strip() for lang in args.langs.split(",") if lang.strip()]
+    return args
+
+
+def main(argv=None):
+    # Windows UTF-8 console fix
+    if hasattr(sys.stdout, 'buffer') and not isinstance(sys.stdout, io.TextIOWrapper):
+        sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    elif hasattr(sys.stdout, 'reconfigure') and sys.stdout.encoding != 'utf-8':
+        sys.stdout.reconfigure(encoding='utf-8')
+
+    args = parse_args(argv)
+    paths = []
+    for lang in args.langs:
+        path = os.path.join(QS_DIR, f"{lang}.txt")
+        if os.path.exists(path):
+            paths.append(path)
+        else:
+            print(f"Warning: {path} not found, skipping.")
+
+    items, statements, status = write_combined(paths, args.output, args.run_size, args.delta, args.shard_size)
+    print(f"Done! Wrote {statements} statements for {items} items from {len(paths)} files to {args.output} ({status})")
+
+
+if __name__ == "__main__":
+    main()
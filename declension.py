@@ -0,0 +1,113 @@
+"""
+Declension of transliterated Japanese names for the multilang labels.
+
+Each language's rules map a word ending to its replacement, per grammatical
+case. The endings of one (language, case) table are compiled once into a
+reversed-suffix trie: a single backwards scan over the word finds the longest
+ending that has a rule, so tables never depend on the order rules are listed
+in. Extra cases cost nothing per word until a label template asks for them.
+"""
+
+# Cyrillic stems of romanized names end in a vowel or н (ん)
+_RU_N_STEMS = ("ан", "ин", "ун", "эн", "он")
+_UK_N_STEMS = ("ан", "ін", "ун", "ен", "он")
+_LT_N_STEMS = ("an", "in", "un", "en", "on")
+
+DECLENSION_RULES = {
+    "ru": {
+        "genitive": {
+            **{stem: stem + "а" for stem in _RU_N_STEMS},
+            "а": "ы",
+            # Spelling rule: ы is written и after velars and sibilants
+            **{c + "а": c + "и" for c in "гкхжчшщ"},
+        },
+        "dative": {
+            **{stem: stem + "у" for stem in _RU_N_STEMS},
+            "а": "е",
+        },
+        "locative": {
+            **{stem: stem + "е" for stem in _RU_N_STEMS},
+            "а": "е",
+        },
+    },
+    "uk": {
+        "genitive": {
+            **{stem: stem + "а" for stem in _UK_N_STEMS},
+            "а": "и",
+        },
+        "dative": {
+            **{stem: stem + "у" for stem in _UK_N_STEMS},
+            "а": "і",
+            # Velars alternate before і: г→з, к→ц, х→с
+            "га": "зі", "ка": "ці", "ха": "сі",
+        },
+        "locative": {
+            **{stem: stem + "і" for stem in _UK_N_STEMS},
+            "а": "і",
+            "га": "зі", "ка": "ці", "ха": "сі",
+        },
+    },
+    "lt": {
+        "genitive": {
+            **{stem: stem + "o" for stem in _LT_N_STEMS},
+            "a": "os", "i": "io", "u": "us", "e": "ės", "o": "o",
+        },
+        "dative": {
+            **{stem: stem + "ui" for stem in _LT_N_STEMS},
+            "a": "ai", "i": "iui", "u": "ui", "e": "ei", "o": "o",
+        },
+        "locative": {
+            **{stem: stem + "e" for stem in _LT_N_STEMS},
+            "a": "oje", "i": "yje", "u": "uje", "e": "ėje", "o": "o",
+        },
+    },
+}
+
+# Languages whose endings match regardless of letter case
+CASE_INSENSITIVE = {"lt"}
+
+# Trie terminal key: (length of the ending, replacement)
+_TERMINAL = ""
+
+
+def compile_suffix_trie(rules):
+    """Compile {ending: replacement} into a trie keyed by the endings' characters, last first."""
+    trie = {}
+    for ending, replacement in rules.items():
+        node = trie
+        for char in reversed(ending):
+            node = node.setdefault(char, {})
+        node[_TERMINAL] = (len(ending), replacement)
+    return trie
+
+
+SUFFIX_TRIES = {
+    (lang, case): compile_suffix_trie(rules)
+    for lang, cases in DECLENSION_RULES.items()
+    for case, rules in cases.items()
+}
+
+
+def decline_word(lang, word, case="genitive"):
+    """Decline one word by its longest ending with a rule; unchanged if none applies."""
+    node = SUFFIX_TRIES[lang, case]
+    key = word.lower() if lang in CASE_INSENSITIVE else word
+    match = None
+    for i in range(len(key) - 1, -1, -1):
+        node = node.get(key[i])
+        if node is None:
+            break
+        match = node.get(_TERMINAL, match)
+    if match is None:
+        return word
+    length, replacement = match
+    return word[:-length] + replacement
+
+
+def decline_name(lang, name, case="genitive"):
+    """Decline the last word of a name, which carries the case in these labels."""
+    words = name.split()
+    if not words:
+        return name
+    words[-1] = decline_word(lang, words[-1], case)
+    return " ".join(words)
@@ -2,16 +2,24 @@
 Generate GitHub Pages HTML for all QuickStatements languages.
 Run from the repo root: python docs/generate_pages.py
 Also called by the GitHub Actions regenerate workflow.
+
+A page is only rebuilt when its QuickStatements file (or the page text
+below) changed since it was last generated: docs/.page_sources.json keeps a
+hash of what each page was built from. Pass --all to rebuild every page.
 """
 
 import os
 import html
 import re
+import json
+import hashlib
+import argparse
 from datetime import datetime
 
 REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DOCS_DIR  = os.path.join(REPO_ROOT, "docs")
 QS_DIR    = os.path.join(REPO_ROOT, "quickstatements")
+SOURCES_PATH = os.path.join(DOCS_DIR, ".page_sources.json")
 
 # (code, english name, native name, flag, methodology HTML)
 LANGS = [
@@ -23,10 +31,14 @@ LANGS = [
         <li>Voiced consonants devoiced: g→k, z→s, d→t, b→p</li>
         <li>Initial H→K, medial H→P</li>
         <li>Long vowels collapsed to short; r→l; chi→si; tsu→tu</li>
-        <li>The mora <em>zu</em> is ambiguous (す or づ) — both <em>su</em> and <em>tu</em> variants are emitted</li>
+        <li>The mora <em>zu</em> is ambiguous (す or づ) — both <em>su</em> and <em>tu</em> variants are generated; the
+        top-ranked (<em>su</em>) one is submitted and the alternative is kept in the CSV for review</li>
       </ul>
       <p>The label is prefixed with <strong>tomo sewi</strong> (shrine) or
-      <strong>tomo sewi suli</strong> (grand shrine / Kuil Agung).</p>"""),
+      <strong>tomo sewi suli</strong> (grand shrine / Kuil Agung).</p>
+      <p>When an item also has Russian, Ukrainian or Lithuanian labels, only the
+      highest-priority source (Indonesian first) is used; the others are listed in the CSV
+      as alternatives.</p>"""),
 
     ("ko", "Korean", "한국어", "🇰🇷", """\
       <p>Two paths depending on the shrine's country:</p>
@@ -244,7 +256,37 @@ PAGE_TEMPLATE = """\
 
 RTL_LANGS = {"fa", "ar", "arz", "he", "ur"}
 
-def main():
+def page_source_hash(txt_path, *page_text):
+    """sha256 of a QuickStatements file together with the template and text of its page."""
+    digest = hashlib.sha256()
+    for part in (PAGE_TEMPLATE, *page_text):
+        digest.update(part.encode("utf-8") + b"\0")
+    with open(txt_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_sources():
+    try:
+        with open(SOURCES_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def save_sources(sources):
+    with open(SOURCES_PATH, "w", encoding="utf-8", newline="\n") as f:
+        json.dump(sources, f, indent=1, sort_keys=True)
+        f.write("\n")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate the GitHub Pages HTML for the QuickStatements files.")
+    parser.add_argument("--all", action="store_true",
+                        help="rebuild every page, even those whose QuickStatements file is unchanged")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    sources = load_sources()
     today = datetime.utcnow().strftime("%Y-%m-%d")
     
     # Update index.html date
@@ -262,7 +304,13 @@ def main():
         if not os.path.exists(txt_path):
             print(f"  Warning: {txt_path} not found, skipping.")
             continue
-            
+
+        out_path = os.path.join(DOCS_DIR, code + ".html")
+        source_hash = page_source_hash(txt_path, english, native, flag, methodology)
+        if not args.all and sources.get(code) == source_hash and os.path.exists(out_path):
+            print(f"  {code}.html — unchanged, skipped")
+            continue
+
         raw = open(txt_path, encoding="utf-8").read()
         # Count only non-empty lines that don't start with #
         count = len([l for l in raw.splitlines() if l.strip() and not l.strip().startswith("#")])
@@ -279,11 +327,12 @@ def main():
             methodology=methodology,
             rtl_attr=rtl_attr,
         )
-        out_path = os.path.join(DOCS_DIR, code + ".html")
         with open(out_path, "w", encoding="utf-8") as f:
             f.write(out)
         size_kb = os.path.getsize(out_path) // 1024
         print(f"  {code}.html — {count:,} statements, {size_kb} KB")
+        sources[code] = source_hash
+        save_sources(sources)
 
     print("Done.")
 
@@ -8,12 +8,17 @@ tokiponize the remaining Japanese name, and produce
 tomo sewi [suli] NAME output.
 """
 
-import re
-import csv
 import sys
 import io
-import requests
-from tokiponizer import tokiponize
+import argparse
+from functools import partial
+from tokiponizer import MAX_VARIANTS, tokiponize_many
+from label_parser import process_label
+from parallel import add_worker_argument, ordered_map
+from pipeline_stages import stream_sparql, prefetch, BackgroundWriter
+from statement_delta import add_delta_argument, delta_callback
+from statement_shards import add_shard_argument, sharded
+from columnar import add_format_argument, open_table, table_path
 
 # Windows UTF-8 console fix (guard against double-wrapping from imports)
 if hasattr(sys.stdout, 'buffer') and not isinstance(sys.stdout, io.TextIOWrapper):
@@ -44,83 +49,47 @@ ORDER BY ?srcLabel
 """
 
 def fetch_shrines():
-    """Fetch target shrine/temple items with Indonesian labels from Wikidata."""
+    """Fetch target shrine/temple items with Indonesian labels from Wikidata (streamed from a background thread)."""
     print("Querying Wikidata SPARQL for Shinto shrines + Japan Buddhist temples with id/ru/uk/lt labels...")
-    r = requests.get(
-        SPARQL_ENDPOINT,
-        params={"query": SPARQL_QUERY, "format": "json"},
-        headers={"User-Agent": "Japanese-Tokiponizer/1.0 (Shinto shrine label pipeline)"},
-        timeout=120,
-    )
-    r.raise_for_status()
-    data = r.json()
-    results = data["results"]["bindings"]
-    print(f"Got {len(results)} results from Wikidata.")
-    return results
-
-PREFIX_RULES = {
-    "id": [
-        ("Kuil Agung ", "Kuil Agung"),
-        ("Kuil ", "Kuil"),
-        ("Wihara Agung ", "Wihara Agung"),
-        ("Wihara ", "Wihara"),
-    ],
-    "ru": [
-        ("Великий храм ", "Temple Grand"),
-        ("Храм ", "Temple"),
-        ("Святилище ", "Shrine"),
-    ],
-    "uk": [
-        ("Великий храм ", "Temple Grand"),
-        ("Храм ", "Temple"),
-        ("Святилище ", "Shrine"),
-    ],
-    "lt": [
-        ("Didžioji šventykla ", "Temple Grand"),
-        ("Šinto šventykla ", "Temple"),
-        ("Šventykla ", "Temple"),
-        ("Maldykla ", "Shrine"),
-    ],
-}
-
-def process_label(source_lang, source_label):
-    """
-    Process a source-language shrine/temple label:
-    1. Remove content in brackets (and the brackets themselves)
-    2. Strip whitespace
-    3. Detect language-specific shrine/temple prefix
-    4. Remove prefix
-    5. Remove spaces and dashes
-    6. Decapitalize
-    Returns (prefix, cleaned_name) or None if no valid prefix found.
+    return prefetch(stream_sparql(
+        SPARQL_QUERY, "Japanese-Tokiponizer/1.0 (Shinto shrine label pipeline)",
+        report="Got {count} results from Wikidata.", timeout=120, endpoint=SPARQL_ENDPOINT,
+    ))
+
+# Source languages in the order their labels are preferred; an item with
+# labels in several of them is transliterated once, from the first
+DEFAULT_SOURCE_PRIORITY = ["id", "ru", "uk", "lt"]
+
+def resolve_sources(bindings, priority=DEFAULT_SOURCE_PRIORITY):
+    """Pick one source label per QID.
+
+    Labels in languages missing from priority, or without a supported
+    shrine/temple prefix, are not candidates. Among the rest the first
+    language in priority wins (ties keep query order). Returns
+    (resolved, unusable): resolved lists (binding, (prefix, cleaned_name),
+    alternatives) for each item in the order its winning label was seen,
+    alternatives being the other candidates as "lang: label" strings.
     """
-    # Remove bracketed content: (stuff), [stuff], {stuff}
-    cleaned = re.sub(r'\([^)]*\)', '', source_label)
-    cleaned = re.sub(r'\[[^\]]*\]', '', cleaned)
-    cleaned = re.sub(r'\{[^}]*\}', '', cleaned)
-    cleaned = cleaned.strip()
-
-    # Detect prefix (case-insensitive for matching, preserve original tail)
-    cleaned_lower = cleaned.lower()
-    rules = PREFIX_RULES.get(source_lang, [])
-    prefix = None
-    name = None
-    for raw_prefix, norm_prefix in rules:
-        raw_prefix_lower = raw_prefix.lower()
-        if cleaned_lower.startswith(raw_prefix_lower):
-            prefix = norm_prefix
-            name = cleaned[len(raw_prefix):]
-            break
-
-    if prefix is None:
-        # Not a supported source-language shrine/temple prefix, skip
-        return None
-
-    # Remove spaces and dashes, decapitalize
-    name = name.replace(" ", "").replace("-", "")
-    name = name.lower()
-
-    return (prefix, name)
+    rank = {lang: i for i, lang in enumerate(priority)}
+    candidates = {}
+    unusable = 0
+    for index, binding in enumerate(bindings):
+        source_lang = binding["srcLang"]["value"]
+        processed = process_label(source_lang, binding["srcLabel"]["value"]) if source_lang in rank else None
+        if processed is None:
+            unusable += 1
+            continue
+        qid = binding["item"]["value"].split("/")[-1]
+        candidates.setdefault(qid, []).append((rank[source_lang], index, binding, processed))
+
+    resolved = []
+    for options in candidates.values():
+        options.sort(key=lambda option: option[:2])
+        _, index, binding, processed = options[0]
+        alternatives = [f'{alt["srcLang"]["value"]}: {alt["srcLabel"]["value"]}' for _, _, alt, _ in options[1:]]
+        resolved.append((index, binding, processed, alternatives))
+    resolved.sort(key=lambda item: item[0])
+    return [item[1:] for item in resolved], unusable
 
 def make_tokipona_label(prefix, tokiponized_name):
     """Build the toki pona label: tomo sewi [suli] NAME"""
@@ -129,10 +98,12 @@ def make_tokipona_label(prefix, tokiponized_name):
     else:
         return f"tomo sewi {tokiponized_name}"
 
-def write_quickstatements(rows, outdir="quickstatements"):
-    """Write QuickStatements lines split by language into outdir/.
+def write_quickstatements(rows, outdir="quickstatements", delta=False, shard_size=0):
+    """Write QuickStatements lines split by language into outdir/
+    (and each file's delta against the previous one, if delta is set, and
+    its batches of shard_size statements, if that is given).
     Each file contains: QID<TAB>L<lang><TAB>\"label\".
-    Returns dict of {lang: filepath} for files written."""
+    Returns dict of {lang: (filepath, "updated" or "unchanged")}."""
     import os
     os.makedirs(outdir, exist_ok=True)
 
@@ -145,7 +116,7 @@ def write_quickstatements(rows, outdir="quickstatements"):
     written = {}
     for lang, lang_rows in sorted(by_lang.items()):
         filepath = os.path.join(outdir, f"{lang}.txt")
-        with open(filepath, "w", encoding="utf-8", newline="\n") as f:
+        with sharded(BackgroundWriter(filepath, before_replace=delta_callback(delta, lang)), lang, shard_size) as f:
             for row in lang_rows:
                 comment = f'# Source: {row["source_lang"]} "{row["source_label"]}"'
                 if row.get("en_label"):
@@ -154,24 +125,51 @@ def write_quickstatements(rows, outdir="quickstatements"):
                 label = row["toki_pona_label"].replace('"', '""')
                 f.write(f'{comment}\n')
                 f.write(f'{row["qid"]}\tL{lang}\t"{label}"\n')
-        written[lang] = filepath
+        written[lang] = (filepath, f.status)
     return written
 
+TABLE_NAME = "shrines_tokiponized"
+TABLE_COLUMNS = [
+    ("qid", "str"), ("en_label", "str"), ("ja_label", "str"), ("source_lang", "str"), ("source_label", "str"),
+    ("target_lang", "str"), ("prefix", "str"), ("cleaned_input", "str"), ("tokiponized", "str"), ("variant_rank", "int"),
+    ("toki_pona_label", "str"), ("has_tok_label", "bool"), ("existing_tok_labels", "str"), ("alternatives", "str"),
+]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Toki Pona label pipeline for Japan shrines/temples.")
+    add_worker_argument(parser)
+    add_delta_argument(parser)
+    add_shard_argument(parser)
+    add_format_argument(parser)
+    parser.add_argument(
+        "--max-variants", type=int, default=MAX_VARIANTS,
+        help=f"keep at most this many ranked variants per name in the CSV (default: {MAX_VARIANTS})",
+    )
+    parser.add_argument(
+        "--source-priority", default=",".join(DEFAULT_SOURCE_PRIORITY),
+        help="comma-separated source languages, most preferred first; others are ignored "
+             f"(default: {','.join(DEFAULT_SOURCE_PRIORITY)})",
+    )
+    args = parser.parse_args(argv)
+    if args.max_variants < 1:
+        parser.error("--max-variants must be at least 1")
+    return args
+
 def main():
+    args = parse_args()
     results = fetch_shrines()
 
+    # Collect existing tok labels and deduplicate SPARQL results (keep the first
+    # (qid, source_lang, source_label) triple) in one pass as the results stream in
     tok_labels_by_qid = {}
+    seen_qids = {}
+    deduped = []
     for binding in results:
         qid = binding["item"]["value"].split("/")[-1]
         tok_label = binding.get("tokLabel", {}).get("value", "")
         if tok_label:
             tok_labels_by_qid.setdefault(qid, set()).add(tok_label)
 
-    # Deduplicate SPARQL results: keep first (qid, source_lang, source_label) triple
-    seen_qids = {}
-    deduped = []
-    for binding in results:
-        qid = binding["item"]["value"].split("/")[-1]
         source_lang = binding["srcLang"]["value"]
         source_label = binding["srcLabel"]["value"]
         key = (qid, source_lang, source_label)
@@ -180,11 +178,21 @@ def main():
             deduped.append(binding)
     print(f"After dedup: {len(deduped)} unique (QID, source_lang, source_label) triples")
 
-    rows = []
-    seen_rows = set()
-    skipped = 0
+    # One source label per item: transliterate only the winner
+    priority = [lang.strip() for lang in args.source_priority.split(",") if lang.strip()]
+    resolved, skipped = resolve_sources(deduped, priority)
+    with_alternatives = sum(1 for _, _, alternatives in resolved if alternatives)
+    print(f"Resolved {len(resolved)} items ({with_alternatives} with alternative source labels)")
+
+    # Tokiponize each distinct cleaned name once, streamed back in input order
+    all_variants = ordered_map(
+        partial(tokiponize_many, max_variants=args.max_variants),
+        ((binding["item"]["value"].split("/")[-1], cleaned_name) for binding, (_, cleaned_name), _ in resolved),
+        workers=args.workers,
+    )
 
-    for binding in deduped:
+    rows = []
+    for (binding, (prefix, cleaned_name), alternatives), variants in zip(resolved, all_variants):
         qid = binding["item"]["value"].split("/")[-1]
         en_label = binding.get("itemLabel", {}).get("value", "")
         source_lang = binding["srcLang"]["value"]
@@ -193,19 +201,7 @@ def main():
         existing_tok_labels = sorted(tok_labels_by_qid.get(qid, set()))
         has_tok_label = len(existing_tok_labels) > 0
 
-        processed = process_label(source_lang, source_label)
-        if processed is None:
-            skipped += 1
-            continue
-
-        prefix, cleaned_name = processed
-        variants = tokiponize(cleaned_name)
-
-        for variant in variants:
-            row_key = (qid, source_lang, source_label, variant)
-            if row_key in seen_rows:
-                continue
-            seen_rows.add(row_key)
+        for rank, variant in enumerate(variants):
             tp_label = make_tokipona_label(prefix, variant)
             rows.append({
                 "qid": qid,
@@ -217,30 +213,27 @@ def main():
                 "cleaned_input": cleaned_name,
                 "target_lang": "tok",
                 "tokiponized": variant,
+                "variant_rank": rank,
                 "toki_pona_label": tp_label,
                 "has_tok_label": has_tok_label,
                 "existing_tok_labels": " | ".join(existing_tok_labels),
+                "alternatives": " | ".join(alternatives),
             })
 
-    # Write CSV
-    outfile = "shrines_tokiponized.csv"
-    with open(outfile, "w", encoding="utf-8-sig", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=[
-            "qid", "en_label", "ja_label", "source_lang", "source_label",
-            "target_lang", "prefix", "cleaned_input", "tokiponized",
-            "toki_pona_label", "has_tok_label", "existing_tok_labels",
-        ])
-        writer.writeheader()
-        writer.writerows(rows)
-
-    print(f"\nDone! Wrote {len(rows)} rows to {outfile}")
-    print(f"Skipped {skipped} entries (no supported source-language prefix)")
-
-    qs_rows = [row for row in rows if not row["has_tok_label"]]
-    written = write_quickstatements(qs_rows)
-    for lang, filepath in written.items():
+    # Write the table (CSV, or columnar with --format columnar)
+    outfile = table_path(TABLE_NAME, args.format)
+    with open_table(TABLE_NAME, TABLE_COLUMNS, args.format, csv_encoding="utf-8-sig") as table:
+        table.writerows(rows)
+
+    print(f"\nDone! Wrote {len(rows)} rows to {outfile} ({table.status})")
+    print(f"Skipped {skipped} source labels (no supported source-language prefix)")
+
+    # Only the best-ranked variant is submitted; alternatives stay in the CSV for review
+    qs_rows = [row for row in rows if not row["has_tok_label"] and row["variant_rank"] == 0]
+    written = write_quickstatements(qs_rows, delta=args.delta, shard_size=args.shard_size)
+    for lang, (filepath, status) in written.items():
         count = sum(1 for r in qs_rows if r.get("target_lang", "tok") == lang)
-        print(f"Wrote {count} QuickStatements lines to {filepath}")
+        print(f"Wrote {count} QuickStatements lines to {filepath} ({status})")
 
     # Print first few for quick review
     print("\n--- Sample output ---")
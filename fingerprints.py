@@ -0,0 +1,122 @@
+"""
+Run fingerprints for the build runner (shrine_labels.py): skip a pipeline
+stage when nothing it depends on has changed since its last successful run.
+
+A stage's fingerprint hashes
+- its script, its arguments and the runner options that shape its outputs
+  (--shard-size, --format), and every repository module the script imports, directly or
+  through other local modules (found by reading the import statements),
+- its local input files (the proposals CSV for multilang, the reading
+  dictionary for the kanji readers),
+- the versions of the third-party converters whose mapping tables it uses
+  (hanja, OpenCC, pykakasi), and the Python version.
+
+Fingerprints are kept in quickstatements/.fingerprints.json next to the
+outputs, with the time each stage was built. The upstream data lives on
+Wikidata and can't be hashed without querying it, so a stage is only
+treated as up to date for a maximum age; past it, the stage runs again.
+"""
+
+import os
+import ast
+import sys
+import json
+import time
+import hashlib
+from functools import lru_cache
+from importlib import metadata
+from pipeline_stages import file_digest
+
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+FINGERPRINTS_PATH = os.path.join(REPO_ROOT, "quickstatements", ".fingerprints.json")
+
+
+@lru_cache(maxsize=None)
+def _imported_modules(path):
+    """Top-level names of the modules a Python file imports."""
+    with open(path, "rb") as f:
+        tree = ast.parse(f.read(), filename=path)
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.add(node.module.split(".")[0])
+    return names
+
+
+def local_modules(script):
+    """Repository files a script runs: itself plus the local modules it imports, transitively."""
+    found = set()
+    frontier = [os.path.join(REPO_ROOT, script)]
+    while frontier:
+        path = frontier.pop()
+        if path in found:
+            continue
+        found.add(path)
+        for name in _imported_modules(path):
+            module_path = os.path.join(REPO_ROOT, name + ".py")
+            if os.path.exists(module_path):
+                frontier.append(module_path)
+    return sorted(os.path.relpath(path, REPO_ROOT) for path in found)
+
+
+def package_version(name):
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def stage_fingerprint(script, args=(), inputs=(), packages=(), options=None):
+    """Hex digest of everything a stage's output depends on, apart from Wikidata itself.
+
+    options is {option: value} of the runner options the stage is given.
+    """
+    manifest = {
+        "script": script,
+        "args": list(args),
+        "code": {path: file_digest(os.path.join(REPO_ROOT, path)) for path in local_modules(script)},
+        "inputs": {path: file_digest(os.path.join(REPO_ROOT, path)) for path in inputs},
+        "packages": {name: package_version(name) for name in packages},
+        "python": "%d.%d" % sys.version_info[:2],
+    }
+    if options:
+        # Only when given, so builds with the default options keep their fingerprints
+        manifest["options"] = dict(options)
+    encoded = json.dumps(manifest, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def load_fingerprints(path=FINGERPRINTS_PATH):
+    """{stage: {"fingerprint": hex, "built_at": unix time}}; empty if there is no file yet."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_fingerprints(records, path=FINGERPRINTS_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8", newline="\n") as f:
+        json.dump(records, f, indent=1, sort_keys=True)
+        f.write("\n")
+    os.replace(tmp_path, path)
+
+
+def is_up_to_date(record, fingerprint, outputs, max_age, now=None):
+    """True if a stage's last build matches fingerprint, is younger than max_age seconds and left all its outputs.
+
+    An output given as a tuple of paths counts as present when any of them exists.
+    """
+    if not record or record.get("fingerprint") != fingerprint:
+        return False
+    now = time.time() if now is None else now
+    if now - record.get("built_at", 0) > max_age:
+        return False
+    return all(
+        any(os.path.exists(os.path.join(REPO_ROOT, path)) for path in ((output,) if isinstance(output, str) else output))
+        for output in outputs
+    )
@@ -13,14 +13,17 @@ import os
 import sys
 import io
 import re
-import requests
+import json
+import argparse
+from functools import lru_cache
+from itertools import islice, tee
+import opencc
 from opencc import OpenCC
-
-# Windows UTF-8 console fix (guard against double-wrapping from imports)
-if hasattr(sys.stdout, 'buffer') and not isinstance(sys.stdout, io.TextIOWrapper):
-    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
-elif hasattr(sys.stdout, 'encoding') and sys.stdout.encoding != 'utf-8':
-    sys.stdout.reconfigure(encoding='utf-8')
+from tokiponizer import compile_token_regex
+from parallel import add_worker_argument, ordered_map
+from pipeline_stages import stream_sparql, prefetch, BackgroundWriter
+from statement_delta import add_delta_argument, delta_callback
+from statement_shards import add_shard_argument, sharded
 
 SPARQL_ENDPOINT = "https://query.wikidata.org/sparql"
 
@@ -43,7 +46,14 @@ ORDER BY ?item
 # OpenCC converter: Traditional → Simplified Chinese
 # Japanese shinjitai is close enough to traditional Chinese for t2s to work.
 # (jp2t config doesn't exist in opencc-python-reimplemented)
-t2s = OpenCC("t2s")
+# Built on first use: loading the dictionaries is most of this module's startup cost.
+@lru_cache(maxsize=None)
+def get_t2s():
+    return OpenCC("t2s")
+
+# Character-level fast path for t2s, derived from OpenCC's own dictionaries and
+# cached on disk; rebuilt whenever the installed dictionaries change.
+T2S_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "t2s_chars.json")
 
 # ----------------------------
 # Kana → Chinese character mapping (man'yogana-style phonetic substitution)
@@ -111,11 +121,109 @@ KANA_TO_CHINESE = {
 }
 
 
-def is_kana(char):
-    """Check if character is hiragana or katakana."""
-    code = ord(char)
-    return (0x3040 <= code <= 0x309F or  # Hiragana
-            0x30A0 <= code <= 0x30FF)    # Katakana
+# Compiled once: multi-character entries (e.g. ヶ丘) as a regex tried first,
+# every single-character entry as a str.translate table for the rest.
+_KANA_MULTI_RE = re.compile("|".join(
+    re.escape(kana) for kana in sorted((k for k in KANA_TO_CHINESE if len(k) > 1), key=len, reverse=True)
+))
+_KANA_TABLE = str.maketrans({k: v for k, v in KANA_TO_CHINESE.items() if len(k) == 1})
+
+# Batches of labels are joined with a separator that OpenCC always splits
+# phrases on (it matches \s+) and passes through untouched, so a single
+# convert() call handles the whole batch.
+OPENCC_BATCH_DELIMITER = "\n"
+OPENCC_BATCH_SIZE = 2000
+
+
+def _t2s_dictionary_files():
+    """The txt dictionaries of t2s, if its chain is the single group this fast path models."""
+    opencc_dir = os.path.dirname(opencc.__file__)
+    with open(os.path.join(opencc_dir, "config", "t2s.json"), encoding="utf-8") as f:
+        chain = json.load(f).get("conversion_chain", [])
+    if len(chain) != 1:
+        return None
+    group = chain[0].get("dict", {})
+    dicts = group.get("dicts", [group]) if group.get("type") == "group" else [group]
+    if any(d.get("type") != "txt" for d in dicts):
+        return None
+    return [os.path.join(opencc_dir, "dictionary", d["file"]) for d in dicts]
+
+
+def build_t2s_table(paths):
+    """Split the t2s dictionaries into a single-character table and the phrase keys.
+
+    Within a group OpenCC tries the dictionaries in order and, for a key with
+    several candidates, uses the first one — so the earliest entry wins here too.
+    Characters OpenCC splits on are never converted, so they stay out of the table.
+    """
+    chars, phrases = {}, set()
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                key, value = line.strip().split("\t")
+                if len(key) > 1:
+                    phrases.add(key)
+                elif key not in chars and not get_t2s().split_chars_re.fullmatch(key):
+                    chars[key] = value.split(" ")[0]
+    return chars, sorted(phrases)
+
+
+@lru_cache(maxsize=None)
+def t2s_fastpath():
+    """Return (translate table, phrase regex) for t2s, or (None, None) if unsupported.
+
+    Loaded on first use. The table is read from T2S_CACHE_PATH when its fingerprint (path, size and
+    mtime of every dictionary) still matches, and rebuilt and saved otherwise.
+    """
+    paths = _t2s_dictionary_files()
+    if not paths:
+        return None, None
+    fingerprint = [[path, os.path.getsize(path), os.stat(path).st_mtime_ns] for path in paths]
+    cached = None
+    try:
+        with open(T2S_CACHE_PATH, encoding="utf-8") as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        pass
+    if cached and cached.get("fingerprint") == fingerprint:
+        chars, phrases = cached["chars"], cached["phrases"]
+    else:
+        chars, phrases = build_t2s_table(paths)
+        try:
+            os.makedirs(os.path.dirname(T2S_CACHE_PATH), exist_ok=True)
+            tmp_path = T2S_CACHE_PATH + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"fingerprint": fingerprint, "chars": chars, "phrases": phrases}, f, ensure_ascii=False)
+            os.replace(tmp_path, T2S_CACHE_PATH)
+        except OSError:
+            pass  # Read-only checkout: just rebuild next run
+    return str.maketrans(chars), compile_token_regex(phrases)
+
+
+def convert_t2s(text):
+    """t2s.convert(), with one str.translate for text that contains no t2s phrase.
+
+    Without a phrase match OpenCC only ever applies single-character entries,
+    so the table gives exactly the same result.
+    """
+    table, phrase_re = t2s_fastpath()
+    if table is None or phrase_re.search(text):
+        return get_t2s().convert(text)
+    return text.translate(table)
+
+
+def substitute_kana(ja_label):
+    """Replace kana with phonetic Chinese characters (multi-char patterns first)."""
+    if not _KANA_MULTI_RE.search(ja_label):
+        return ja_label.translate(_KANA_TABLE)
+    parts = []
+    pos = 0
+    for match in _KANA_MULTI_RE.finditer(ja_label):
+        parts.append(ja_label[pos:match.start()].translate(_KANA_TABLE))
+        parts.append(KANA_TO_CHINESE[match.group()])
+        pos = match.end()
+    parts.append(ja_label[pos:].translate(_KANA_TABLE))
+    return "".join(parts)
 
 
 def japanese_to_chinese(ja_label):
@@ -127,98 +235,114 @@ def japanese_to_chinese(ja_label):
     if not ja_label:
         return None
 
-    # First pass: replace kana with Chinese characters
-    # Try multi-char patterns first (e.g., ヶ丘), then single chars
-    result = []
-    i = 0
-    while i < len(ja_label):
-        # Try 2-char pattern
-        if i + 1 < len(ja_label):
-            pair = ja_label[i:i+2]
-            if pair in KANA_TO_CHINESE:
-                result.append(KANA_TO_CHINESE[pair])
-                i += 2
-                continue
-
-        char = ja_label[i]
-        if char in KANA_TO_CHINESE:
-            result.append(KANA_TO_CHINESE[char])
-        elif is_kana(char):
-            # Unknown kana — skip (shouldn't happen with complete mapping)
-            result.append(char)
-        else:
-            result.append(char)
-        i += 1
-
-    intermediate = "".join(result)
+    # Kana without a mapping are kept as-is
+    intermediate = substitute_kana(ja_label)
 
     # Second pass: convert to simplified Chinese via OpenCC
-    simplified = t2s.convert(intermediate)
+    simplified = convert_t2s(intermediate)
 
     # If result still contains kana, it's incomplete — but still return it
     return simplified if simplified else None
 
 
+def japanese_to_chinese_many(ja_labels, batch_size=OPENCC_BATCH_SIZE):
+    """Yield japanese_to_chinese() for each label.
+
+    Labels without a t2s phrase go through the character table; the rest of
+    each batch is converted with one OpenCC call.
+    """
+    table, phrase_re = t2s_fastpath()
+    ja_labels = iter(ja_labels)
+    while True:
+        batch = list(islice(ja_labels, batch_size))
+        if not batch:
+            return
+        intermediates = [substitute_kana(ja_label) if ja_label else "" for ja_label in batch]
+        if table is None:
+            phrased = list(range(len(batch)))
+        else:
+            phrased = [i for i, text in enumerate(intermediates) if phrase_re.search(text)]
+        if any(OPENCC_BATCH_DELIMITER in intermediates[i] for i in phrased):
+            # Can't split this batch back apart safely; convert one by one
+            yield from map(japanese_to_chinese, batch)
+            continue
+        converted = intermediates if table is None else [text.translate(table) for text in intermediates]
+        if phrased:
+            joined = get_t2s().convert(OPENCC_BATCH_DELIMITER.join(intermediates[i] for i in phrased))
+            for i, simplified in zip(phrased, joined.split(OPENCC_BATCH_DELIMITER)):
+                converted[i] = simplified
+        for ja_label, simplified in zip(batch, converted):
+            yield simplified if ja_label and simplified else None
+
+
 def fetch_shrines():
-    """Fetch shrines with Japanese labels but no Chinese labels."""
+    """Fetch shrines with Japanese labels but no Chinese labels (streamed from a background thread)."""
     print("Querying Wikidata for shrines without Chinese labels...")
-    r = requests.get(
-        SPARQL_ENDPOINT,
-        params={"query": SPARQL_QUERY, "format": "json"},
-        headers={"User-Agent": "Japanese-Tokiponizer/1.0 (Chinese label pipeline)"},
-        timeout=300,
-    )
-    r.raise_for_status()
-    data = r.json()
-    results = data["results"]["bindings"]
-    print(f"Got {len(results)} results from Wikidata.")
-    return results
+    return prefetch(stream_sparql(
+        SPARQL_QUERY, "Japanese-Tokiponizer/1.0 (Chinese label pipeline)",
+        report="Got {count} results from Wikidata.", endpoint=SPARQL_ENDPOINT,
+    ))
 
 
-def main():
-    results = fetch_shrines()
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Chinese label pipeline for Japan shrines/temples.")
+    add_worker_argument(parser)
+    add_delta_argument(parser)
+    add_shard_argument(parser)
+    return parser.parse_args(argv)
 
-    # Deduplicate by QID
-    seen = set()
-    deduped = []
-    for binding in results:
-        qid = binding["item"]["value"].split("/")[-1]
-        if qid not in seen:
-            seen.add(qid)
-            deduped.append(binding)
-    print(f"After dedup: {len(deduped)} unique shrines without Chinese labels")
 
-    rows = []
-    skipped = 0
+def main():
+    # Windows UTF-8 console fix (in main() so importing this module has no side effects)
+    if hasattr(sys.stdout, 'buffer') and not isinstance(sys.stdout, io.TextIOWrapper):
+        sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    elif hasattr(sys.stdout, 'reconfigure') and sys.stdout.encoding != 'utf-8':
+        sys.stdout.reconfigure(encoding='utf-8')
 
-    for binding in deduped:
-        qid = binding["item"]["value"].split("/")[-1]
-        ja_label = binding.get("jaLabel", {}).get("value", "")
+    args = parse_args()
+    results = fetch_shrines()
 
-        zh_label = japanese_to_chinese(ja_label)
+    # Deduplicate by QID as the results stream in
+    def deduped():
+        seen = set()
+        for binding in results:
+            qid = binding["item"]["value"].split("/")[-1]
+            if qid not in seen:
+                seen.add(qid)
+                yield (qid, binding.get("jaLabel", {}).get("value", ""))
 
-        if zh_label:
-            rows.append({"qid": qid, "ja_label": ja_label, "zh_label": zh_label})
-        else:
-            skipped += 1
+    items, to_convert = tee(deduped())
+    zh_labels = ordered_map(japanese_to_chinese_many, to_convert, workers=args.workers)
 
-    # Write QuickStatements with comments
+    # Labels are written as they are converted; the file replaces the
+    # previous output once the run has finished, if anything changed
     outdir = "quickstatements"
     os.makedirs(outdir, exist_ok=True)
     filepath = os.path.join(outdir, "zh.txt")
-    with open(filepath, "w", encoding="utf-8", newline="\n") as f:
-        for row in rows:
-            label = row["zh_label"].replace('"', '""')
-            f.write(f'# Source: JA "{row["ja_label"]}"\n')
-            f.write(f'{row["qid"]}\tLzh\t"{label}"\n')
-
-    print(f"\nDone! Wrote {len(rows)} Chinese QuickStatements to {filepath}")
+    unique = written = skipped = 0
+    samples = []
+    writer = BackgroundWriter(filepath, before_replace=delta_callback(args.delta, "zh"))
+    with sharded(writer, "zh", args.shard_size) as f:
+        for (qid, ja_label), zh_label in zip(items, zh_labels):
+            unique += 1
+            if not zh_label:
+                skipped += 1
+                continue
+            label = zh_label.replace('"', '""')
+            f.write(f'# Source: JA "{ja_label}"\n')
+            f.write(f'{qid}\tLzh\t"{label}"\n')
+            written += 1
+            if len(samples) < 20:
+                samples.append((qid, ja_label, zh_label))
+    print(f"After dedup: {unique} unique shrines without Chinese labels")
+
+    print(f"\nDone! Wrote {written} Chinese QuickStatements to {filepath} ({f.status})")
     print(f"Skipped {skipped} items (no translatable label)")
 
     # Sample output
     print("\n--- Sample output ---")
-    for row in rows[:20]:
-        print(f"  {row['qid']:12s} | {row['ja_label']:20s} → {row['zh_label']}")
+    for qid, ja_label, zh_label in samples:
+        print(f"  {qid:12s} | {ja_label:20s} → {zh_label}")
 
 
 if __name__ == "__main__":
@@ -4,18 +4,30 @@ Generate proposed Indonesian labels for Japanese-only shrines/temples.
 2. Fetch 'ja' label, 'en' label (if any), and optional Kana reading (P1814/P5461).
 3. Convert to Romaji (Hepburn) using pykakasi.
 4. Strip common shrine/temple suffixes to avoid redundancy in "Kuil [Name]".
-5. Output to 'proposed_indonesian_labels.csv' and 'quickstatements/id_proposed.txt'.
+5. Output to 'proposed_indonesian_labels.csv' (or .cols with --format columnar)
+   and 'quickstatements/id_proposed.txt'.
 """
 
 import os
 import sys
-import csv
 import re
-import requests
-import pykakasi
+import argparse
+from functools import lru_cache
+from itertools import tee
+from tokiponizer import KANA_ROMAJI, katakana_to_hiragana, compile_token_regex
+from reading_dictionary import segment_readings
+from parallel import add_worker_argument, ordered_map
+from pipeline_stages import stream_sparql, prefetch, BackgroundWriter
+from statement_delta import add_delta_argument, delta_callback
+from statement_shards import add_shard_argument, sharded
+from columnar import add_format_argument, open_table
 
-# Initialize pykakasi (v2.3.0 API)
-kks = pykakasi.kakasi()
+# pykakasi (v2.3.0 API) is imported and initialized on first use: loading its
+# dictionaries takes far longer than everything else this module does at import.
+@lru_cache(maxsize=None)
+def get_kks():
+    import pykakasi
+    return pykakasi.kakasi()
 
 SPARQL_ENDPOINT = "https://query.wikidata.org/sparql"
 
@@ -43,33 +55,107 @@ SELECT DISTINCT ?item ?jaLabel ?enLabel ?kanaName ?kanaReading WHERE {
 """
 
 def fetch_candidates():
-    results = []
-    print("Querying Wikidata for Japanese-only Shrines...")
-    try:
-        r = requests.get(SPARQL_ENDPOINT, params={"query": SPARQL_SHRINES, "format": "json"}, headers={"User-Agent": "Japanese-Tokiponizer/1.0"}, timeout=300)
-        r.raise_for_status()
-        bindings = r.json()["results"]["bindings"]
-        for b in bindings:
-            b["type"] = {"value": "shrine"}
-            results.append(b)
-    except Exception as e: print(f"Error fetching shrines: {e}")
-
-    print("Querying Wikidata for Japanese-only Temples...")
-    try:
-        r = requests.get(SPARQL_ENDPOINT, params={"query": SPARQL_TEMPLES, "format": "json"}, headers={"User-Agent": "Japanese-Tokiponizer/1.0"}, timeout=300)
-        r.raise_for_status()
-        bindings = r.json()["results"]["bindings"]
-        for b in bindings:
-            b["type"] = {"value": "temple"}
-            results.append(b)
-    except Exception as e: print(f"Error fetching temples: {e}")
-    return results
+    """Stream Japanese-only shrines, then temples, tagging each binding with its type.
+
+    A failed query raises: the writers then discard the partial output and
+    keep the previous run's files.
+    """
+    for item_type, query in (("shrine", SPARQL_SHRINES), ("temple", SPARQL_TEMPLES)):
+        print(f"Querying Wikidata for Japanese-only {item_type.capitalize()}s...")
+        for b in stream_sparql(query, "Japanese-Tokiponizer/1.0", endpoint=SPARQL_ENDPOINT):
+            b["type"] = {"value": item_type}
+            yield b
+
+# ----------------------------
+# Kana-only fast path
+# ----------------------------
+# P1814/P5461 readings are usually pure kana, which needs no dictionary: they
+# are romanized with the project's kana table, spelled the way pykakasi's
+# Hepburn mode does. The shared table collapses some sounds for Toki Pona.
+HEPBURN_OVERRIDES = {"ず": "zu", "づ": "zu", "ゐ": "i", "ゑ": "e"}
+HEPBURN_KANA = {**KANA_ROMAJI, **HEPBURN_OVERRIDES}
+SOKUON = "っ"
+CHOONPU = "ー"
+# pykakasi writes っ as "tsu" rather than doubling before these (and at the end)
+SOKUON_AS_TSU = frozenset("あいうえおなにぬねのまみむめもわゐゑをんぜー")
+# ...and spells these doubled forms irregularly, so leave them to pykakasi
+SOKUON_UNSUPPORTED = frozenset({"っ", "ぢゃ", "ぢゅ", "ぢょ"})
+N_APOSTROPHE_BEFORE = frozenset("あいうえお")
+
+_HEPBURN_TOKEN_RE = compile_token_regex(HEPBURN_KANA, extra=(SOKUON, CHOONPU))
+_HIRAGANA = "".join(sorted({ch for kana in HEPBURN_KANA for ch in kana} | {SOKUON}))
+_KATAKANA = "".join(chr(ord(ch) + 0x60) for ch in _HIRAGANA)
+# pykakasi starts a new word whenever the script changes; ー belongs to the word before it
+_KANA_RUN_RE = re.compile(f"[{_HIRAGANA}][{_HIRAGANA}{CHOONPU}]*|[{_KATAKANA}][{_KATAKANA}{CHOONPU}]*")
+
+
+def _kana_run_to_hepburn(run):
+    """Hepburn for one single-script kana run, or None if it needs pykakasi."""
+    hiragana = katakana_to_hiragana(run)
+    tokens = _HEPBURN_TOKEN_RE.findall(hiragana)
+    if "".join(tokens) != hiragana:
+        return None  # e.g. a small ゃ that doesn't follow an i-row kana
+    out = ""
+    for i, token in enumerate(tokens):
+        following = tokens[i + 1] if i + 1 < len(tokens) else ""
+        if token == SOKUON:
+            # Doubles the next consonant (tch before ch)
+            if following in SOKUON_UNSUPPORTED:
+                return None
+            if not following or following[0] in SOKUON_AS_TSU:
+                out += "tsu"
+            else:
+                romaji = HEPBURN_KANA[following]
+                out += "t" if romaji.startswith("ch") else romaji[0]
+        elif token == CHOONPU:
+            out += out[-1]
+        elif token == "ん" and following[:1] in N_APOSTROPHE_BEFORE:
+            out += "n'"
+        else:
+            out += HEPBURN_KANA[token]
+    return out
+
+
+def kana_to_hepburn_words(text):
+    """Romanize kana-only text as pykakasi would, one string per word.
+
+    Returns None when text contains anything the kana table can't spell on its
+    own (kanji, small vowels, iteration marks, spaces...).
+    """
+    runs = _KANA_RUN_RE.findall(text)
+    if not runs or "".join(runs) != text:
+        return None
+    words = [_kana_run_to_hepburn(run) for run in runs]
+    return None if None in words else words
+
+
+def dictionary_hepburn_words(text):
+    """Hepburn words for text from the reading dictionary (one per compound or kana run).
+
+    Returns None unless the dictionary covers every kanji in text.
+    """
+    segments = segment_readings(text)
+    if segments is None:
+        return None
+    words = [_kana_run_to_hepburn(reading) for _, reading in segments]
+    return None if None in words else words
+
+
+@lru_cache(maxsize=None)
+def pykakasi_hepburn_words(text):
+    """pykakasi's Hepburn words for text, memoized (shrine names repeat a lot)."""
+    return tuple(item['hepburn'] for item in get_kks().convert(text))
+
 
 def to_romaji(text):
     cleaned = re.sub(r'\(.*?\)|（.*?）', '', text).strip()
-    result = kks.convert(cleaned)
+    words = kana_to_hepburn_words(cleaned) or dictionary_hepburn_words(cleaned) or pykakasi_hepburn_words(cleaned)
+    return romaji_name(words)
+
+def romaji_name(words):
+    """Turn Hepburn words into the proposed name: title case, no macrons or shrine suffix."""
     # Get Hepburn, join parts
-    name = " ".join([item['hepburn'] for item in result]).title()
+    name = " ".join(words).title()
     
     # Normalize macrons for Indonesian (nearly 1-1 with Hepburn but usually no macrons)
     name = name.replace("ā", "a").replace("ī", "i").replace("ū", "u").replace("ē", "e").replace("ō", "o")
@@ -88,50 +174,74 @@ def to_romaji(text):
             break
     return name
 
+def to_romaji_many(texts):
+    """Yield (name, error) for each text; error is the message if to_romaji() raised."""
+    for text in texts:
+        try:
+            yield to_romaji(text), None
+        except Exception as e:
+            yield None, str(e)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Proposed Indonesian labels for Japanese-only shrines/temples.")
+    add_worker_argument(parser)
+    add_delta_argument(parser)
+    add_shard_argument(parser)
+    add_format_argument(parser)
+    return parser.parse_args(argv)
+
+PROPOSALS_TABLE = "proposed_indonesian_labels"
+PROPOSALS_QS = os.path.join("quickstatements", "id_proposed.txt")
+PROPOSAL_COLUMNS = [(name, "str") for name in ("qid", "ja_label", "en_label", "romaji", "type", "proposed_label")]
+
+def source_text(binding):
+    """Text to romanize: the kana name or reading when the item has one, else the ja label."""
+    return binding.get("kanaName", {}).get("value") or binding.get("kanaReading", {}).get("value") or binding["jaLabel"]["value"]
+
+def write_quickstatement(f, p):
+    """Write one proposal as a commented QuickStatements line."""
+    comment = f'# Source: JA "{p["ja_label"]}"'
+    if p["en_label"]: comment += f' | EN "{p["en_label"]}"'
+    comment += f' -> Indonesian "{p["proposed_label"]}"'
+    f.write(f'{comment}\n{p["qid"]}\tLid\t"{p["proposed_label"]}"\n')
+
 def main():
-    results = fetch_candidates()
-    proposals = []
+    args = parse_args()
+    # Downloaded in a background thread while earlier items are romanized
+    results, to_romanize = tee(prefetch(fetch_candidates()))
     print("Processing items...")
-    for binding in results:
-        qid = binding["item"]["value"].split("/")[-1]
-        ja_label = binding["jaLabel"]["value"]
-        en_label = binding.get("enLabel", {}).get("value", "")
-        source_text = binding.get("kanaName", {}).get("value") or binding.get("kanaReading", {}).get("value") or ja_label
-        item_type = binding["type"]["value"]
-        
-        try:
-            name = to_romaji(source_text)
+    items = ((binding["item"]["value"].split("/")[-1], source_text(binding)) for binding in to_romanize)
+    # Romanized in worker batches, yielded back in input order
+    romanized = ordered_map(to_romaji_many, items, workers=args.workers)
+
+    # Rows are written as results arrive; the temp files replace the previous
+    # output only once the run has finished, and only if they changed
+    written = 0
+    qs_writer = BackgroundWriter(PROPOSALS_QS, before_replace=delta_callback(args.delta, "id_proposed"))
+    with open_table(PROPOSALS_TABLE, PROPOSAL_COLUMNS, args.format) as table, \
+            sharded(qs_writer, "id_proposed", args.shard_size) as qs_f:
+        for binding, (name, error) in zip(results, romanized):
+            qid = binding["item"]["value"].split("/")[-1]
+            item_type = binding["type"]["value"]
+
+            if error is not None:
+                print(f"Error processing {qid}: {error}")
+                continue
             if not name: continue
-            
+
             prefix = "Kuil" if item_type == "shrine" else "Wihara"
-            proposed_label = f"{prefix} {name}"
-            
-            proposals.append({
+            proposal = {
                 "qid": qid,
-                "ja_label": ja_label,
-                "en_label": en_label,
+                "ja_label": binding["jaLabel"]["value"],
+                "en_label": binding.get("enLabel", {}).get("value", ""),
                 "romaji": name,
                 "type": item_type,
-                "proposed_label": proposed_label
-            })
-        except Exception as e:
-            print(f"Error processing {qid}: {e}")
-
-    # Write CSV
-    with open("proposed_indonesian_labels.csv", "w", encoding="utf-8", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=["qid", "ja_label", "en_label", "romaji", "type", "proposed_label"])
-        writer.writeheader()
-        writer.writerows(proposals)
-    
-    # Write QuickStatements with comments
-    qs_file = os.path.join("quickstatements", "id_proposed.txt")
-    with open(qs_file, "w", encoding="utf-8", newline="\n") as f:
-        for p in proposals:
-            comment = f'# Source: JA "{p["ja_label"]}"'
-            if p["en_label"]: comment += f' | EN "{p["en_label"]}"'
-            comment += f' -> Indonesian "{p["proposed_label"]}"'
-            f.write(f'{comment}\n{p["qid"]}\tLid\t"{p["proposed_label"]}"\n')
-    print(f"Wrote {len(proposals)} proposals to {qs_file}")
+                "proposed_label": f"{prefix} {name}"
+            }
+            table.writerow(proposal)
+            write_quickstatement(qs_f, proposal)
+            written += 1
+    print(f"Wrote {written} proposals to {PROPOSALS_QS} ({qs_f.status}; {table.path} {table.status})")
 
 if __name__ == "__main__":
     main()
@@ -12,16 +12,17 @@ import os
 import sys
 import io
 import re
-import requests
+import argparse
+from functools import lru_cache
+from itertools import tee
 import hanja
-from koreanizer import koreanize
-from fetch_shrines_tokiponize import process_label
-
-# Windows UTF-8 console fix (guard against double-wrapping from imports)
-if hasattr(sys.stdout, 'buffer') and not isinstance(sys.stdout, io.TextIOWrapper):
-    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
-elif hasattr(sys.stdout, 'encoding') and sys.stdout.encoding != 'utf-8':
-    sys.stdout.reconfigure(encoding='utf-8')
+from koreanizer import koreanize, koreanize_many
+from label_parser import process_label
+from reading_dictionary import lookup_reading
+from parallel import add_worker_argument, ordered_map
+from pipeline_stages import stream_sparql, prefetch, BackgroundWriter
+from statement_delta import add_delta_argument, delta_callback
+from statement_shards import add_shard_argument, sharded
 
 SPARQL_ENDPOINT = "https://query.wikidata.org/sparql"
 
@@ -71,19 +72,42 @@ KOREAN_SUFFIX = {
 
 
 def run_sparql(query, label):
-    """Run a SPARQL query and return results."""
+    """Run a SPARQL query; results stream in from a background thread."""
     print(f"Querying Wikidata: {label}...")
-    r = requests.get(
-        SPARQL_ENDPOINT,
-        params={"query": query, "format": "json"},
-        headers={"User-Agent": "Japanese-Tokiponizer/1.0 (Korean label pipeline)"},
-        timeout=300,
-    )
-    r.raise_for_status()
-    data = r.json()
-    results = data["results"]["bindings"]
-    print(f"  Got {len(results)} results.")
-    return results
+    return prefetch(stream_sparql(
+        query, "Japanese-Tokiponizer/1.0 (Korean label pipeline)",
+        report=f"  Got {{count}} results ({label}).", endpoint=SPARQL_ENDPOINT,
+    ))
+
+
+# One regex pass splits a label into typed script runs:
+# group 1 = hiragana/katakana, group 2 = CJK ideographs, no group = anything
+# else (dropped, as are the characters between runs).
+SCRIPT_RUN_RE = re.compile(
+    r"([\u3040-\u30FF]+)|([\u3400-\u4DBF\u4E00-\u9FFF]+)|[^\u3040-\u30FF\u3400-\u4DBF\u4E00-\u9FFF]+"
+)
+CJK_RE = re.compile(r"[\u3400-\u4DBF\u4E00-\u9FFF]")
+
+
+@lru_cache(maxsize=None)
+def _hanja_run(kanji):
+    """Sino-Korean reading of one kanji run, or None if it can't be read.
+
+    Runs hanja leaves untranslated (kokuji such as 榊 have no Korean
+    reading) are koreanized from their Japanese reading when the reading
+    dictionary covers them. Runs such as 神社 and 八幡 repeat thousands of
+    times, so each distinct run is translated once.
+    """
+    translated = hanja.translate(kanji, "substitution")
+    if not CJK_RE.search(translated):
+        return translated
+    reading = lookup_reading(kanji)
+    return koreanize(reading) if reading else None
+
+
+@lru_cache(maxsize=None)
+def _kana_run(kana):
+    return koreanize(kana)
 
 
 def japanese_to_korean_hanja(ja_label):
@@ -96,138 +120,145 @@ def japanese_to_korean_hanja(ja_label):
         return None
 
     result_parts = []
-    current_kana = []
-    current_kanji = []
-
-    for char in ja_label:
-        if '\u3040' <= char <= '\u309F' or '\u30A0' <= char <= '\u30FF':
-            # Hiragana or Katakana
-            if current_kanji:
-                kanji_str = "".join(current_kanji)
-                translated = hanja.translate(kanji_str, "substitution")
-                result_parts.append(translated)
-                current_kanji = []
-            current_kana.append(char)
-        elif '\u4E00' <= char <= '\u9FFF' or '\u3400' <= char <= '\u4DBF':
-            # CJK Unified Ideograph
-            if current_kana:
-                kana_str = "".join(current_kana)
-                result_parts.append(koreanize(kana_str))
-                current_kana = []
-            current_kanji.append(char)
-        else:
-            if current_kanji:
-                kanji_str = "".join(current_kanji)
-                translated = hanja.translate(kanji_str, "substitution")
-                result_parts.append(translated)
-                current_kanji = []
-            if current_kana:
-                kana_str = "".join(current_kana)
-                result_parts.append(koreanize(kana_str))
-                current_kana = []
-
-    if current_kanji:
-        kanji_str = "".join(current_kanji)
-        translated = hanja.translate(kanji_str, "substitution")
-        result_parts.append(translated)
-    if current_kana:
-        kana_str = "".join(current_kana)
-        result_parts.append(koreanize(kana_str))
+    for run in SCRIPT_RUN_RE.finditer(ja_label):
+        kana, kanji = run.groups()
+        if kanji:
+            translated = _hanja_run(kanji)
+            if translated is None:
+                # hanja couldn't translate (returned original kanji)
+                return None
+            result_parts.append(translated)
+        elif kana:
+            result_parts.append(_kana_run(kana))
 
     result = "".join(result_parts)
-    # If hanja couldn't translate (returned original kanji), return None
-    if any('\u4E00' <= c <= '\u9FFF' or '\u3400' <= c <= '\u4DBF' for c in result):
-        return None
     return result if result else None
 
 
+def japanese_to_korean_hanja_many(ja_labels):
+    """Yield japanese_to_korean_hanja() for each label, converting repeats once."""
+    cache = {}
+    for ja_label in ja_labels:
+        if ja_label not in cache:
+            cache[ja_label] = japanese_to_korean_hanja(ja_label)
+        yield cache[ja_label]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Korean label pipeline for Japan shrines/temples.")
+    add_worker_argument(parser)
+    add_delta_argument(parser)
+    add_shard_argument(parser)
+    return parser.parse_args(argv)
+
+
 def main():
-    rows = []
+    # Windows UTF-8 console fix (in main() so importing this module has no side effects)
+    if hasattr(sys.stdout, 'buffer') and not isinstance(sys.stdout, io.TextIOWrapper):
+        sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    elif hasattr(sys.stdout, 'reconfigure') and sys.stdout.encoding != 'utf-8':
+        sys.stdout.reconfigure(encoding='utf-8')
+
+    args = parse_args()
+    outdir = "quickstatements"
+    os.makedirs(outdir, exist_ok=True)
+    filepath = os.path.join(outdir, "ko.txt")
+
+    # Labels are written as they are generated; the file replaces the
+    # previous output once the run has finished, if anything changed
+    written = 0
+    samples = []
+
+    def write_label(qid, ko_label, comment):
+        nonlocal written
+        label = ko_label.replace('"', '""')
+        out.write(f'{comment}\n')
+        out.write(f'{qid}\tLko\t"{label}"\n')
+        written += 1
+        if len(samples) < 20:
+            samples.append((qid, ko_label))
+
     seen_qids = set()
     skipped = 0
 
     # --- Path 1: Shrines with Indonesian labels → koreanize ---
     id_results = run_sparql(SPARQL_ID, "shrines with Indonesian labels, no Korean")
 
-    for binding in id_results:
-        qid = binding["item"]["value"].split("/")[-1]
-        if qid in seen_qids:
-            continue
-        seen_qids.add(qid)
-
-        id_label = binding["idLabel"]["value"]
-        ja_label = binding.get("jaLabel", {}).get("value", "")
-
-        processed = process_label("id", id_label)
-        if processed is None:
-            # Indonesian label didn't match known prefix — try hanja fallback
-            if ja_label:
-                ko_label = japanese_to_korean_hanja(ja_label)
-                if ko_label:
-                    rows.append({
-                        "qid": qid, 
-                        "ko_label": ko_label, 
-                        "comment": f'# Source: JA "{ja_label}" (hanja reading fallback)'
-                    })
+    def id_candidates():
+        for binding in id_results:
+            qid = binding["item"]["value"].split("/")[-1]
+            if qid in seen_qids:
+                continue
+            seen_qids.add(qid)
+
+            id_label = binding["idLabel"]["value"]
+            ja_label = binding.get("jaLabel", {}).get("value", "")
+            yield (qid, id_label, ja_label, process_label("id", id_label))
+
+    # Koreanize each distinct cleaned name once; consumed in step with candidates
+    candidates, to_koreanize = tee(id_candidates())
+    koreanized = ordered_map(
+        koreanize_many,
+        ((c[0], c[3][1]) for c in to_koreanize if c[3] is not None),
+        workers=args.workers,
+    )
+
+    writer = BackgroundWriter(filepath, before_replace=delta_callback(args.delta, "ko"))
+    with sharded(writer, "ko", args.shard_size) as out:
+        for qid, id_label, ja_label, processed in candidates:
+            if processed is None:
+                # Indonesian label didn't match known prefix — try hanja fallback
+                if ja_label:
+                    ko_label = japanese_to_korean_hanja(ja_label)
+                    if ko_label:
+                        write_label(qid, ko_label, f'# Source: JA "{ja_label}" (hanja reading fallback)')
+                    else:
+                        skipped += 1
                 else:
                     skipped += 1
+                continue
+
+            prefix, cleaned_name = processed
+            suffix = KOREAN_SUFFIX.get(prefix, "신사")
+            korean_name = next(koreanized)
+            if korean_name:
+                write_label(qid, f"{korean_name} {suffix}", f'# Source: ID "{id_label}" (romanization)')
             else:
                 skipped += 1
-            continue
-
-        prefix, cleaned_name = processed
-        suffix = KOREAN_SUFFIX.get(prefix, "신사")
-        korean_name = koreanize(cleaned_name)
-        if korean_name:
-            rows.append({
-                "qid": qid, 
-                "ko_label": f"{korean_name} {suffix}",
-                "comment": f'# Source: ID "{id_label}" (romanization)'
-            })
-        else:
-            skipped += 1
-
-    print(f"After Indonesian path: {len(rows)} labels generated")
-
-    # --- Path 2: Shrines with Japanese labels only → hanja ---
-    ja_results = run_sparql(SPARQL_JA, "shrines with Japanese labels only, no Korean")
-
-    for binding in ja_results:
-        qid = binding["item"]["value"].split("/")[-1]
-        if qid in seen_qids:
-            continue
-        seen_qids.add(qid)
-
-        ja_label = binding["jaLabel"]["value"]
-        ko_label = japanese_to_korean_hanja(ja_label)
-        if ko_label:
-            rows.append({
-                "qid": qid, 
-                "ko_label": ko_label,
-                "comment": f'# Source: JA "{ja_label}" (hanja reading)'
-            })
-        else:
-            skipped += 1
-
-    print(f"After both paths: {len(rows)} labels generated")
-
-    # Write QuickStatements
-    outdir = "quickstatements"
-    os.makedirs(outdir, exist_ok=True)
-    filepath = os.path.join(outdir, "ko.txt")
-    with open(filepath, "w", encoding="utf-8", newline="\n") as f:
-        for row in rows:
-            label = row["ko_label"].replace('"', '""')
-            f.write(f'{row["comment"]}\n')
-            f.write(f'{row["qid"]}\tLko\t"{label}"\n')
 
-    print(f"\nDone! Wrote {len(rows)} Korean QuickStatements to {filepath}")
+        # Shut the worker pool down before path 2 starts its own
+        koreanized.close()
+
+        print(f"After Indonesian path: {written} labels generated")
+
+        # --- Path 2: Shrines with Japanese labels only → hanja ---
+        ja_results = run_sparql(SPARQL_JA, "shrines with Japanese labels only, no Korean")
+
+        def ja_only():
+            for binding in ja_results:
+                qid = binding["item"]["value"].split("/")[-1]
+                if qid in seen_qids:
+                    continue
+                seen_qids.add(qid)
+                yield (qid, binding["jaLabel"]["value"])
+
+        items, to_translate = tee(ja_only())
+        ko_labels = ordered_map(japanese_to_korean_hanja_many, to_translate, workers=args.workers)
+        for (qid, ja_label), ko_label in zip(items, ko_labels):
+            if ko_label:
+                write_label(qid, ko_label, f'# Source: JA "{ja_label}" (hanja reading)')
+            else:
+                skipped += 1
+
+        print(f"After both paths: {written} labels generated")
+
+    print(f"\nDone! Wrote {written} Korean QuickStatements to {filepath} ({out.status})")
     print(f"Skipped {skipped} items (no translatable label)")
 
     # Sample output
     print("\n--- Sample output ---")
-    for row in rows[:20]:
-        print(f"  {row['qid']:12s} | {row['ko_label']}")
+    for qid, ko_label in samples:
+        print(f"  {qid:12s} | {ko_label}")
 
 
 if __name__ == "__main__":
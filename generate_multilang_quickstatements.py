@@ -18,16 +18,18 @@ import os
 import sys
 import io
 import re
-import csv
+import argparse
 import unicodedata
-import requests
+from functools import partial
+from itertools import tee
 from tokiponizer import kana_to_romaji, tokenize_romaji
-
-# Windows UTF-8 console fix
-if hasattr(sys.stdout, 'buffer') and not isinstance(sys.stdout, io.TextIOWrapper):
-    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
-elif hasattr(sys.stdout, 'encoding') and sys.stdout.encoding != 'utf-8':
-    sys.stdout.reconfigure(encoding='utf-8')
+from label_parser import parse_label
+from declension import decline_name
+from parallel import add_worker_argument, ordered_map
+from pipeline_stages import stream_sparql, prefetch, BackgroundWriter
+from statement_delta import add_delta_argument, delta_callback
+from statement_shards import add_shard_argument, sharded
+from columnar import find_table, iter_rows
 
 SPARQL_ENDPOINT = "https://query.wikidata.org/sparql"
 
@@ -276,28 +278,26 @@ def farsify(name):
 # Name extraction
 # ----------------------------
 
+# Indonesian prefix (as normalized by label_parser) → (is_grand, p_type)
+# Kuil = Shrine (usually), Wihara = Temple
+ID_PREFIX_TYPES = {
+    "Kuil Agung": (True, "shrine"),
+    "Kuil": (False, "shrine"),
+    "Wihara Agung": (True, "temple"),
+    "Wihara": (False, "temple"),
+}
+
 def extract_name(id_label):
     """Extract shrine/temple name from Indonesian label, preserving original casing.
     Returns (name, is_grand, p_type) or None.
     p_type is 'shrine' or 'temple'."""
-    cleaned = re.sub(r'\([^)]*\)', '', id_label)
-    cleaned = re.sub(r'\[[^\]]*\]', '', cleaned)
-    cleaned = cleaned.strip()
-    
-    # Check prefixes
-    # Kuil = Shrine (usually), Wihara = Temple
-    prefixes = [
-        ("Kuil Agung ", True, "shrine"),
-        ("Kuil ", False, "shrine"),
-        ("Wihara Agung ", True, "temple"),
-        ("Wihara ", False, "temple"),
-    ]
-    
-    for prefix, is_grand, p_type in prefixes:
-        if cleaned.startswith(prefix):
-            name = cleaned[len(prefix):].strip()
-            return (name, is_grand, p_type) if name else None
-    return None
+    parsed = parse_label("id", id_label)
+    if parsed is None:
+        return None
+    prefix, name = parsed
+    name = name.strip()
+    is_grand, p_type = ID_PREFIX_TYPES[prefix]
+    return (name, is_grand, p_type) if name else None
 
 # ----------------------------
 # Cyrillicization (Polivanov system)
@@ -345,148 +345,137 @@ def lithuanize(name):
 # Declension functions
 # ----------------------------
 
-def _decline_word_lithuanian(word):
-    """Apply Lithuanian genitive to the last word."""
-    lower = word.lower()
-    for ending, repl in [("an", "ano"), ("in", "ino"), ("un", "uno"),
-                         ("en", "eno"), ("on", "ono")]:
-        if lower.endswith(ending):
-            return word[:-len(ending)] + repl
-    for ending, repl in [("a", "os"), ("i", "io"), ("u", "us"),
-                         ("e", "ės"), ("o", "o")]:
-        if lower.endswith(ending):
-            return word[:-len(ending)] + repl
-    return word
-
+# The affixes govern the genitive; the rule tables live in declension.py
 
 def decline_lithuanian(name):
-    words = name.split()
-    if not words:
-        return name
-    words[-1] = _decline_word_lithuanian(words[-1])
-    return " ".join(words)
-
-
-def _decline_word_russian(word):
-    for ending, repl in [("ан", "ана"), ("ин", "ина"), ("ун", "уна"),
-                         ("эн", "эна"), ("он", "она")]:
-        if word.endswith(ending):
-            return word[:-len(ending)] + repl
-    if word.endswith("а"):
-        if len(word) >= 2 and word[-2] in "гкхжчшщ":
-            return word[:-1] + "и"
-        return word[:-1] + "ы"
-    return word
+    return decline_name("lt", name)
 
 
 def decline_russian(name):
-    words = name.split()
-    if not words:
-        return name
-    words[-1] = _decline_word_russian(words[-1])
-    return " ".join(words)
-
-
-def _decline_word_ukrainian(word):
-    for ending, repl in [("ан", "ана"), ("ін", "іна"), ("ун", "уна"),
-                         ("ен", "ена"), ("он", "она")]:
-        if word.endswith(ending):
-            return word[:-len(ending)] + repl
-    if word.endswith("а"):
-        return word[:-1] + "и"
-    return word
+    return decline_name("ru", name)
 
 
 def decline_ukrainian(name):
-    words = name.split()
-    if not words:
-        return name
-    words[-1] = _decline_word_ukrainian(words[-1])
-    return " ".join(words)
+    return decline_name("uk", name)
 
 # ----------------------------
 # Label formatters per language
 # ----------------------------
 
+def arabify_egyptian(name):
+    """Egyptian Arabic: MSA script with ج for the hard g (غ)."""
+    return arabify(name).replace("غ", "ج")
+
+
+def _affix(shrine, grand_shrine, temple=None, grand_temple=None):
+    """Affix table for one language: {p_type: (plain, grand)}; temples default to the shrine words."""
+    return {
+        "shrine": (shrine, grand_shrine),
+        "temple": (temple or shrine, grand_temple or grand_shrine),
+    }
+
+
+# One entry per target language:
+#   affix   — the shrine/temple word(s), see _affix(); an affix containing "…"
+#             wraps the name, which takes the place of the ellipsis
+#   order   — where name and affix go, as a template or {p_type: template}
+#   script  — renders the romanized name in the target script/orthography
+#   decline — puts the rendered name into the case the affix governs
+# Adding a language is one more entry here.
+LABEL_SPECS = {
+    "tr": {"affix": _affix("Tapınağı", "Büyük Tapınağı"),
+           "order": "{name} {affix}"},
+    "de": {"affix": _affix("Schrein", "Großschrein", "Tempel", "Großtempel"),
+           "order": {"shrine": "{name} {affix}", "temple": "{name}-{affix}"}},  # e.g. Senso-Tempel
+    "nl": {"affix": _affix("-shrijn", "-shrijn", "tempel", "grote tempel"),
+           "order": {"shrine": "{name}{affix}", "temple": "{name}-{affix}"}},  # Ise-shrijn
+    "es": {"affix": _affix("Santuario", "Gran Santuario", "Templo", "Gran Templo"),
+           "order": "{affix} {name}"},
+    "it": {"affix": _affix("Santuario", "Grande Santuario", "Tempio", "Grande Tempio"),
+           "order": "{affix} {name}"},
+    "eu": {"affix": _affix("santutegia", "santutegi handia", "tenplua", "tenplu handia"),
+           "order": "{name} {affix}"},
+    "lt": {"affix": _affix("maldykla", "maldykla", "šventykla", "didžioji šventykla"),
+           "order": "{name} {affix}",
+           "script": lithuanize, "decline": decline_lithuanian},
+    "ru": {"affix": _affix("Храм", "Большой храм", "Храм", "Великий храм"),
+           "order": "{affix} {name}",
+           "script": partial(cyrillicize, lang="ru"), "decline": decline_russian},
+    "uk": {"affix": _affix("Святилище", "Велике святилище", "Храм", "Великий храм"),
+           "order": "{affix} {name}",
+           "script": partial(cyrillicize, lang="uk"), "decline": decline_ukrainian},
+    "fa": {"affix": _affix("معبد", "معبد بزرگ"),
+           "order": "{affix} {name}",
+           "script": farsify},
+    "ar": {"affix": _affix("معبد", "معبد … الكبير"),
+           "order": "{affix} {name}",
+           "script": arabify},
+    "arz": {"affix": _affix("معبد", "معبد … الكبير"),
+            "order": "{affix} {name}",
+            "script": arabify_egyptian},
+    "hi": {"affix": _affix("मंदिर", "महा मंदिर"),
+           "order": "{name} {affix}",
+           "script": hindify},
+    "fr": {"affix": _affix("Sanctuaire", "Grand Sanctuaire", "Temple", "Grand Temple"),
+           "order": "{affix} {name}"},
+    "pt": {"affix": _affix("Santuário", "Grande Santuário", "Templo", "Grande Templo"),
+           "order": "{affix} {name}"},
+}
+
+
+def compile_label_spec(spec):
+    """Compile a LABEL_SPECS entry into format(name, is_grand, p_type) -> label.
+
+    The affix and word order are resolved up front into a (before, after)
+    pair for each of the four shrine/temple × plain/grand combinations, so
+    formatting a label is one renderer call and a concatenation.
+    """
+    script = spec.get("script")
+    decline = spec.get("decline")
+    frames = {}
+    for p_type, affixes in spec["affix"].items():
+        order = spec["order"]
+        if isinstance(order, dict):
+            order = order[p_type]
+        for is_grand, affix in zip((False, True), affixes):
+            template = affix.replace("…", "{name}") if "…" in affix else order.replace("{affix}", affix)
+            before, after = template.split("{name}")
+            frames[p_type == "temple", is_grand] = (before, after)
+
+    def format_one(name, is_grand=False, p_type="shrine"):
+        if script is not None:
+            name = script(name)
+        if decline is not None:
+            name = decline(name)
+        before, after = frames[p_type == "temple", bool(is_grand)]
+        return f"{before}{name}{after}"
+
+    return format_one
+
+
+LABEL_FORMATTERS = {lang: compile_label_spec(spec) for lang, spec in LABEL_SPECS.items()}
+
+
 def format_label(lang, name, is_grand=False, p_type="shrine"):
-    """Format a shrine/temple name into a target-language label."""
-    
-    # Helper for generic temple/shrine words
-    def get_affix():
-        if lang == "tr": return "Büyük Tapınağı" if is_grand else "Tapınağı"
-        if lang == "de": 
-            if p_type == "temple": return "Großtempel" if is_grand else "Tempel"
-            return "Großschrein" if is_grand else "Schrein"
-        if lang == "nl": 
-            if p_type == "temple": return "grote tempel" if is_grand else "tempel"
-            return "-shrijn"
-        if lang == "es":
-            if p_type == "temple": return "Gran Templo" if is_grand else "Templo"
-            return "Gran Santuario" if is_grand else "Santuario"
-        if lang == "it":
-            if p_type == "temple": return "Grande Tempio" if is_grand else "Tempio"
-            return "Grande Santuario" if is_grand else "Santuario"
-        if lang == "eu":
-            if p_type == "temple": return "tenplu handia" if is_grand else "tenplua"
-            return "santutegi handia" if is_grand else "santutegia"
-        if lang == "lt":
-            if p_type == "temple": return "didžioji šventykla" if is_grand else "šventykla"
-            return "maldykla"
-        if lang == "ru":
-            if p_type == "temple": return "Великий храм" if is_grand else "Храм"
-            return "Большой храм" if is_grand else "Храм"
-        if lang == "uk":
-            if p_type == "temple": return "Великий храм" if is_grand else "Храм"
-            return "Велике святилище" if is_grand else "Святилище"
-        if lang == "fr":
-            if p_type == "temple": return "Grand Temple" if is_grand else "Temple"
-            return "Grand Sanctuaire" if is_grand else "Sanctuaire"
-        if lang == "pt":
-            if p_type == "temple": return "Grande Templo" if is_grand else "Templo"
-            return "Grande Santuário" if is_grand else "Santuário"
-        if lang == "fa": return "معبد بزرگ" if is_grand else "معبد"
-        if lang == "ar": return "معبد … الكبير" if is_grand else "معبد"
-        if lang == "arz": return "معبد … الكبير" if is_grand else "معبد"
-        if lang == "hi": return "महा मंदिर" if is_grand else "मंदिर"
-        return ""
-
-    if lang == "tr":
-        return f"{name} {get_affix()}"
-    if lang == "de":
-        if p_type == "temple": return f"{name}-{get_affix()}" # e.g. Senso-Tempel
-        return f"{name} {get_affix()}"
-    if lang == "nl":
-        if p_type == "temple": return f"{name}-{get_affix()}"
-        return f"{name}{get_affix()}" # Ise-shrijn
-    if lang in ["es", "it", "fr", "pt"]:
-        return f"{get_affix()} {name}"
-    if lang == "eu":
-        return f"{name} {get_affix()}"
-    if lang == "lt":
-        lt_name = lithuanize(name)
-        lt_name = decline_lithuanian(lt_name)
-        return f"{lt_name} {get_affix()}"
-    if lang == "ru":
-        cy_name = cyrillicize(name, "ru")
-        cy_name = decline_russian(cy_name)
-        return f"{get_affix()} {cy_name}"
-    if lang == "uk":
-        cy_name = cyrillicize(name, "uk")
-        cy_name = decline_ukrainian(cy_name)
-        return f"{get_affix()} {cy_name}"
-    if lang == "fa":
-        fa_name = farsify(name)
-        return f"{get_affix()} {fa_name}"
-    if lang in ["ar", "arz"]:
-        ar_name = arabify(name)
-        if lang == "arz":
-            ar_name = ar_name.replace("غ", "ج")
-        base = f"معبد {ar_name}"
-        return f"{base} الكبير" if is_grand else base
-    if lang == "hi":
-        hi_name = hindify(name)
-        return f"{hi_name} {get_affix()}"
-    return None
+    """Format a shrine/temple name into a target-language label, or None for an unknown language."""
+    formatter = LABEL_FORMATTERS.get(lang)
+    return formatter(name, is_grand, p_type) if formatter else None
+
+
+def format_labels_many(items, langs):
+    """Format an iterable of (name, is_grand, p_type) items into labels.
+
+    Yields one tuple per item with a label (or None) for each language in
+    langs. Identical items are formatted once and the cached tuple is
+    broadcast back in input order.
+    """
+    formatters = [LABEL_FORMATTERS.get(lang) for lang in langs]
+    cache = {}
+    for item in items:
+        labels = cache.get(item)
+        if labels is None:
+            labels = cache[item] = tuple(fmt(*item) if fmt else None for fmt in formatters)
+        yield labels
 
 # ----------------------------
 # SPARQL
@@ -514,30 +503,20 @@ ORDER BY ?item
 
 
 def run_sparql(query, label):
+    """Run a SPARQL query; results stream in from a background thread."""
     print(f"  Querying Wikidata: {label}...")
-    r = requests.get(
-        SPARQL_ENDPOINT,
-        params={"query": query, "format": "json"},
-        headers={"User-Agent": "Japanese-Tokiponizer/1.0 (multilang label pipeline)"},
-        timeout=300,
-    )
-    r.raise_for_status()
-    data = r.json()
-    results = data["results"]["bindings"]
-    print(f"  Got {len(results)} results.")
-    return results
+    return prefetch(stream_sparql(
+        query, "Japanese-Tokiponizer/1.0 (multilang label pipeline)",
+        report="  Got {count} results.", endpoint=SPARQL_ENDPOINT,
+    ))
 
 def load_proposals():
-    """Load local Indonesian label proposals."""
-    path = "proposed_indonesian_labels.csv"
-    if not os.path.exists(path):
+    """Load local Indonesian label proposals (CSV or columnar), only the columns used here."""
+    path = find_table("proposed_indonesian_labels")
+    if path is None:
         return []
-    
-    proposals = []
-    with open(path, "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            proposals.append(row)
+
+    proposals = list(iter_rows(path, ["qid", "proposed_label"]))
     print(f"  Loaded {len(proposals)} local proposals.")
     return proposals
 
@@ -545,83 +524,123 @@ def load_proposals():
 # Main
 # ----------------------------
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Multi-language label pipeline for Japan shrines/temples.")
+    add_worker_argument(parser)
+    add_delta_argument(parser)
+    add_shard_argument(parser)
+    parser.add_argument(
+        "--langs", default=",".join(ALL_LANGS),
+        help="comma-separated target languages to generate (default: all)",
+    )
+    args = parser.parse_args(argv)
+    args.langs = [lang.strip() for lang in args.langs.split(",") if lang.strip()]
+    unknown = [lang for lang in args.langs if lang not in ALL_LANGS]
+    if unknown:
+        parser.error(f"unknown language(s): {', '.join(unknown)} (choose from {', '.join(ALL_LANGS)})")
+    return args
+
+
 def main():
+    # Windows UTF-8 console fix (in main() so importing this module has no side effects)
+    if hasattr(sys.stdout, 'buffer') and not isinstance(sys.stdout, io.TextIOWrapper):
+        sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    elif hasattr(sys.stdout, 'reconfigure') and sys.stdout.encoding != 'utf-8':
+        sys.stdout.reconfigure(encoding='utf-8')
+
+    args = parse_args()
     outdir = "quickstatements"
     os.makedirs(outdir, exist_ok=True)
     
     # Load proposals once
     local_proposals = load_proposals()
 
-    for lang in ALL_LANGS:
+    for lang in args.langs:
         print(f"\n=== {lang.upper()} ===")
-        
-        rows = []
+        format_lang = partial(format_labels_many, langs=(lang,))
+
         seen = set()
-        
+        skipped = 0
+        written = 0
+        samples = []
+        filepath = os.path.join(outdir, f"{lang}.txt")
+
+        def write_label(f, qid, label):
+            nonlocal written
+            escaped = label.replace('"', '""')
+            f.write(f'{qid}\tL{lang}\t"{escaped}"\n')
+            written += 1
+            if len(samples) < 5:
+                samples.append((qid, label))
+
         # 1. From Wikidata
         results = run_sparql(make_sparql(lang), f"shrines missing {lang} label")
-        skipped = 0
-        
-        for binding in results:
-            qid = binding["item"]["value"].split("/")[-1]
-            if qid in seen:
-                continue
-            seen.add(qid)
-
-            id_label = binding["idLabel"]["value"]
-            extracted = extract_name(id_label)
-            if not extracted:
-                skipped += 1
-                continue
-            name, is_grand, p_type = extracted
-
-            label = format_label(lang, name, is_grand, p_type)
-            if label:
-                rows.append({"qid": qid, "label": label})
-            else:
-                skipped += 1
-                
-        print(f"  From Wikidata: {len(rows)} rows")
+
+        def from_wikidata():
+            nonlocal skipped
+            for binding in results:
+                qid = binding["item"]["value"].split("/")[-1]
+                if qid in seen:
+                    continue
+                seen.add(qid)
+
+                id_label = binding["idLabel"]["value"]
+                extracted = extract_name(id_label)
+                if not extracted:
+                    skipped += 1
+                    continue
+                yield (qid, extracted)
 
         # 2. From Local Proposals
         # These are items that have JA label but NO ID label on Wikidata.
         # So they won't be in the SPARQL results (which require ID label).
         # We assume they also don't have the target language label (since they are 'Japanese-only').
-        
-        added_local = 0
-        for p in local_proposals:
-            qid = p["qid"]
-            if qid in seen:
-                continue
-            
-            # Use the proposed ID label as source
-            id_label = p["proposed_label"]
-            # We also have p["type"] but let's re-extract to be safe/consistent
-            extracted = extract_name(id_label)
-            if not extracted:
-                continue
-            name, is_grand, p_type = extracted
-            
-            label = format_label(lang, name, is_grand, p_type)
-            if label:
-                rows.append({"qid": qid, "label": label})
-                seen.add(qid)
-                added_local += 1
-        
-        print(f"  From Local Proposals: {added_local} rows")
-
-        # Write QuickStatements
-        filepath = os.path.join(outdir, f"{lang}.txt")
-        with open(filepath, "w", encoding="utf-8", newline="\n") as f:
-            for row in rows:
-                escaped = row["label"].replace('"', '""')
-                f.write(f'{row["qid"]}\tL{lang}\t"{escaped}"\n')
-
-        print(f"  Total: Wrote {len(rows)} to {filepath}")
+        def from_proposals():
+            for p in local_proposals:
+                qid = p["qid"]
+                if qid in seen:
+                    continue
+
+                # Use the proposed ID label as source
+                id_label = p["proposed_label"]
+                # We also have p["type"] but let's re-extract to be safe/consistent
+                extracted = extract_name(id_label)
+                if not extracted:
+                    continue
+                yield (qid, extracted)
+
+        # Labels are written as they are formatted; the file replaces the
+        # previous output once the language is finished, if anything changed
+        writer = BackgroundWriter(filepath, before_replace=delta_callback(args.delta, lang))
+        with sharded(writer, lang, args.shard_size) as f:
+            pending, to_format = tee(from_wikidata())
+            labels = ordered_map(format_lang, to_format, workers=args.workers)
+            for (qid, _), (label,) in zip(pending, labels):
+                if label:
+                    write_label(f, qid, label)
+                else:
+                    skipped += 1
+
+            from_wikidata_rows = written
+            print(f"  From Wikidata: {from_wikidata_rows} rows")
+
+            pending, to_format = tee(from_proposals())
+            labels = ordered_map(format_lang, to_format, workers=args.workers)
+            for (qid, _), (label,) in zip(pending, labels):
+                # Proposals may repeat a QID (one row per kana reading)
+                if qid in seen:
+                    continue
+                if label:
+                    write_label(f, qid, label)
+                    seen.add(qid)
+
+            print(f"  From Local Proposals: {written - from_wikidata_rows} rows")
+
+        print(f"  Total: Wrote {written} to {filepath} ({f.status})")
 
         # Sample
-        for row in rows[:5]:
-            print(f"    {row['qid']:12s} | {row['label']}")
+        for qid, label in samples:
+            print(f"    {qid:12s} | {label}")
 
     print("\nDone!")
 
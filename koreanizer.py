@@ -4,7 +4,7 @@ Converts Japanese kana/romaji into Korean hangul approximation,
 preserving voiced/unvoiced distinctions (unlike tokiponizer which devoices).
 """
 
-from tokiponizer import normalize, kana_to_romaji, tokenize_romaji
+from tokiponizer import normalize, kana_to_romaji, compile_token_regex
 
 # ----------------------------
 # Romaji → Hangul syllable mapping
@@ -78,85 +78,110 @@ YOON_TO_HANGUL = {
 }
 
 # ----------------------------
-# Unicode arithmetic for batchim (final consonant)
+# Jamo-index composer
 # ----------------------------
 # Korean syllable blocks: base = 0xAC00
 # Each block = (initial * 21 + medial) * 28 + final
-# ㄴ (nieun) as final = 4
+# The tables above are decomposed once into jamo indices, so every output
+# syllable — including a folded final — is a single chr() of a sum.
 
 HANGUL_BASE = 0xAC00
-FINAL_NIEUN = 4  # ㄴ batchim index
-
-def _has_final(char):
-    """Check if a hangul syllable character already has a final consonant (batchim)."""
-    code = ord(char) - HANGUL_BASE
-    if code < 0 or code >= 11172:
-        return False
-    return (code % 28) != 0
-
-def _add_nieun_batchim(char):
-    """Add ㄴ batchim to a hangul syllable that has no final consonant."""
-    code = ord(char) - HANGUL_BASE
-    if code < 0 or code >= 11172:
-        return char + "ㄴ"
-    if (code % 28) != 0:
-        # Already has a batchim, can't merge — append standalone ㄴ
-        return char + "ㄴ"
-    return chr(ord(char) + FINAL_NIEUN)
-
-
-def tokenize_romaji_korean(text):
-    """Tokenize romaji for Korean mapping (uses same logic as tokiponizer
-    but checks Korean-specific maps)."""
-    tokens = []
-    i = 0
-    while i < len(text):
-        matched = False
-        for size in (3, 2, 1):
-            chunk = text[i:i+size]
-            if chunk in YOON_TO_HANGUL or chunk in ROMAJI_TO_HANGUL:
-                tokens.append(chunk)
-                i += size
-                matched = True
-                break
-        if not matched:
-            i += 1
-    return tokens
-
-
-def koreanize(text):
+FINAL_NIEUN = 4   # ㄴ batchim index (ん)
+FINAL_SIOT = 19   # ㅅ batchim index (っ, e.g. 삿포로)
+
+# Standalone jamo for a final with no open syllable to attach to
+# (a sokuon with nowhere to go is dropped)
+FINAL_JAMO = {FINAL_NIEUN: "ㄴ"}
+
+# Tokens that close the preceding syllable instead of starting a new one
+CODA_TOKENS = {"n": FINAL_NIEUN}
+
+# Sokuon spellings: っ, or the first consonant of a doubled pair (tt, pp, tch...)
+SOKUON_TOKENS = {"っ": FINAL_SIOT, **{c: FINAL_SIOT for c in "bcdfghjkmprstwz"}}
+
+
+def decompose_syllable(syllable):
+    """(initial, medial, final) jamo indices of a precomposed hangul syllable."""
+    code = ord(syllable) - HANGUL_BASE
+    return code // (21 * 28), code // 28 % 21, code % 28
+
+
+def compose_syllable(initial, medial, final=0):
+    """Compose a hangul syllable block from its jamo indices."""
+    return HANGUL_BASE + (initial * 21 + medial) * 28 + final
+
+
+_HANGUL_TOKENS = {**ROMAJI_TO_HANGUL, **YOON_TO_HANGUL}
+
+# token → code point of its open syllable; a final index is simply added
+_OPEN_SYLLABLES = {
+    token: compose_syllable(*decompose_syllable(syllable)[:2])
+    for token, syllable in _HANGUL_TOKENS.items()
+    if token not in CODA_TOKENS
+}
+
+_TOKEN_RE = compile_token_regex(_HANGUL_TOKENS)
+_SOKUON_TOKEN_RE = compile_token_regex(
+    _HANGUL_TOKENS, ["っ", "t(?=ch)", *(f"{c}(?={c})" for c in "bcdfghjkmprstwz")]
+)
+
+
+def compose_hangul(romaji, sokuon=False):
+    """Compose romaji into hangul in one pass over its tokens.
+
+    ん is folded into the preceding open syllable as a ㄴ final (or kept as a
+    standalone ㄴ when there is none). With sokuon=True, っ and doubled
+    consonants become a ㅅ final the same way; otherwise they are dropped.
+    """
+    codas = {**CODA_TOKENS, **SOKUON_TOKENS} if sokuon else CODA_TOKENS
+    out = []
+    pending = 0   # open syllable not yet emitted (0 = none)
+    final = 0
+    for token in (_SOKUON_TOKEN_RE if sokuon else _TOKEN_RE).findall(romaji):
+        coda = codas.get(token)
+        if coda is None:
+            if pending:
+                out.append(chr(pending + final))
+            pending = _OPEN_SYLLABLES[token]
+            final = 0
+        elif pending and not final:
+            final = coda
+        else:
+            if pending:
+                out.append(chr(pending + final))
+                pending = 0
+            if coda in FINAL_JAMO:
+                out.append(FINAL_JAMO[coda])
+    if pending:
+        out.append(chr(pending + final))
+    return "".join(out)
+
+
+def koreanize(text, sokuon=False):
     """Convert Japanese text (kana or romaji) to Korean hangul approximation.
 
     Returns a single string (no variants, unlike tokiponize).
     """
-    text = normalize(text)
-    text = kana_to_romaji(text)
-
-    tokens = tokenize_romaji_korean(text)
-
-    # Map tokens to hangul
-    hangul_parts = []
-    for t in tokens:
-        if t in YOON_TO_HANGUL:
-            hangul_parts.append(YOON_TO_HANGUL[t])
-        elif t in ROMAJI_TO_HANGUL:
-            hangul_parts.append(ROMAJI_TO_HANGUL[t])
-
-    # Merge standalone ㄴ (from ん) as batchim into preceding syllable
-    merged = []
-    for part in hangul_parts:
-        if part == "ㄴ" and merged:
-            prev = merged[-1]
-            last_char = prev[-1]
-            # Try to merge ㄴ as batchim into the last character
-            if '\uAC00' <= last_char <= '\uD7A3' and not _has_final(last_char):
-                merged[-1] = prev[:-1] + _add_nieun_batchim(last_char)
-            else:
-                merged.append("ㄴ")
-        else:
-            merged.append(part)
+    return _koreanize_normalized(normalize(text), sokuon)
+
+
+def _koreanize_normalized(text, sokuon=False):
+    return compose_hangul(kana_to_romaji(text), sokuon)
 
-    return "".join(merged)
+
+def koreanize_many(texts, sokuon=False):
+    """Koreanize an iterable of names, yielding one hangul string per input.
+
+    Each distinct normalized name is converted once and the result is
+    broadcast back to every input that shares it, in input order.
+    """
+    cache = {}
+    for text in texts:
+        key = normalize(text)
+        korean = cache.get(key)
+        if korean is None:
+            korean = cache[key] = _koreanize_normalized(key, sokuon)
+        yield korean
 
 
 if __name__ == "__main__":
@@ -164,3 +189,4 @@ if __name__ == "__main__":
     print(koreanize("じんじゃ"))       # 진자
     print(koreanize("トヨタマヒメ"))   # 토요타마히메
     print(koreanize("かんだ"))         # 칸다
+    print(koreanize("さっぽろ", sokuon=True))  # 삿포로
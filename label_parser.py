@@ -0,0 +1,111 @@
+"""
+Source-label parsing shared by the label pipelines: strip bracketed content,
+detect and remove the language-specific shrine/temple prefix, and normalize
+the remaining name. Depends only on the standard library, so the converters
+can import it without pulling in a pipeline script.
+
+The prefixes of every source language are compiled into one character trie,
+brackets are stripped by a single precompiled regex, and each label is parsed
+once per process: the Toki Pona, Korean and multilang pipelines all read the
+same Indonesian labels.
+"""
+
+import re
+from functools import lru_cache
+
+PREFIX_RULES = {
+    "id": [
+        ("Kuil Agung ", "Kuil Agung"),
+        ("Kuil ", "Kuil"),
+        ("Wihara Agung ", "Wihara Agung"),
+        ("Wihara ", "Wihara"),
+    ],
+    "ru": [
+        ("Великий храм ", "Temple Grand"),
+        ("Храм ", "Temple"),
+        ("Святилище ", "Shrine"),
+    ],
+    "uk": [
+        ("Великий храм ", "Temple Grand"),
+        ("Храм ", "Temple"),
+        ("Святилище ", "Shrine"),
+    ],
+    "lt": [
+        ("Didžioji šventykla ", "Temple Grand"),
+        ("Šinto šventykla ", "Temple"),
+        ("Šventykla ", "Temple"),
+        ("Maldykla ", "Shrine"),
+    ],
+}
+
+# (stuff), [stuff], {stuff}
+BRACKETS_RE = re.compile(r'\([^)]*\)|\[[^\]]*\]|\{[^}]*\}')
+
+# Trie terminal key: {source_lang: (rule index, raw prefix, normalized prefix)}
+_TERMINAL = ""
+
+
+def build_prefix_trie(rules_by_lang):
+    """Compile {lang: [(raw_prefix, norm_prefix)]} into one lower-cased character trie."""
+    trie = {}
+    for lang, rules in rules_by_lang.items():
+        for index, (raw_prefix, norm_prefix) in enumerate(rules):
+            node = trie
+            for char in raw_prefix.lower():
+                node = node.setdefault(char, {})
+            node.setdefault(_TERMINAL, {}).setdefault(lang, (index, raw_prefix, norm_prefix))
+    return trie
+
+
+PREFIX_TRIE = build_prefix_trie(PREFIX_RULES)
+
+
+def match_prefix(source_lang, text):
+    """Return (raw_prefix, norm_prefix) of the source_lang rule text starts with, or None.
+
+    Matching is case-insensitive. When several rules match, the one listed
+    first in PREFIX_RULES wins.
+    """
+    node = PREFIX_TRIE
+    best = None
+    for char in text.lower():
+        node = node.get(char)
+        if node is None:
+            break
+        rule = node.get(_TERMINAL, {}).get(source_lang)
+        if rule is not None and (best is None or rule[0] < best[0]):
+            best = rule
+    return None if best is None else best[1:]
+
+
+@lru_cache(maxsize=None)
+def parse_label(source_lang, source_label):
+    """
+    Split a source-language shrine/temple label into its prefix and name:
+    1. Remove content in brackets (and the brackets themselves)
+    2. Strip whitespace
+    3. Detect and remove the language-specific shrine/temple prefix
+    Returns (norm_prefix, name) with the name's original casing and spacing,
+    or None if no valid prefix found.
+    """
+    cleaned = BRACKETS_RE.sub('', source_label).strip()
+    matched = match_prefix(source_lang, cleaned)
+    if matched is None:
+        # Not a supported source-language shrine/temple prefix, skip
+        return None
+    raw_prefix, norm_prefix = matched
+    return (norm_prefix, cleaned[len(raw_prefix):])
+
+
+@lru_cache(maxsize=None)
+def process_label(source_lang, source_label):
+    """
+    Process a source-language shrine/temple label: parse_label(), then
+    remove spaces and dashes from the name and decapitalize it.
+    Returns (prefix, cleaned_name) or None if no valid prefix found.
+    """
+    parsed = parse_label(source_lang, source_label)
+    if parsed is None:
+        return None
+    prefix, name = parsed
+    return (prefix, name.replace(" ", "").replace("-", "").lower())
@@ -0,0 +1,94 @@
+"""
+Process-pool execution for the transformation step of the label pipelines.
+
+Items are (qid, payload) tuples. Each batch of items is sharded across the
+workers by a stable hash of the QID, only the compact payloads cross the
+process boundary, and the results are merged back into input order — so the
+files written with --workers N are byte-identical to a single-process run.
+"""
+
+import os
+import zlib
+from collections import deque
+from itertools import islice
+
+DEFAULT_BATCH_SIZE = 5000
+
+
+def add_worker_argument(parser):
+    """Add the shared --workers option to a pipeline's argument parser."""
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="worker processes for the transform step (0 = one per CPU core, default: 1)",
+    )
+
+
+def resolve_workers(workers):
+    """Turn a --workers value into a process count (0 or less means all cores)."""
+    if workers is None or workers <= 0:
+        return os.cpu_count() or 1
+    return workers
+
+
+def shard_of(qid, shards):
+    """Stable shard index for a QID (unlike hash(), identical across processes)."""
+    return zlib.crc32(qid.encode("utf-8")) % shards
+
+
+def _run_shard(func, positions, payloads):
+    return positions, list(func(payloads))
+
+
+def _submit(pool, func, batch, shards):
+    positions = [[] for _ in range(shards)]
+    payloads = [[] for _ in range(shards)]
+    for pos, (qid, payload) in enumerate(batch):
+        shard = shard_of(qid, shards)
+        positions[shard].append(pos)
+        payloads[shard].append(payload)
+    futures = [
+        pool.submit(_run_shard, func, shard_positions, shard_payloads)
+        for shard_positions, shard_payloads in zip(positions, payloads)
+        if shard_positions
+    ]
+    return len(batch), futures
+
+
+def _collect(size, futures):
+    results = [None] * size
+    for future in futures:
+        positions, shard_results = future.result()
+        for pos, result in zip(positions, shard_results):
+            results[pos] = result
+    return results
+
+
+def ordered_map(func, items, workers=1, batch_size=DEFAULT_BATCH_SIZE):
+    """Apply a batch converter to (qid, payload) items, yielding results in input order.
+
+    func takes an iterable of payloads and returns an iterable with one result
+    per payload (e.g. tokiponize_many). With a single worker it is simply
+    called on the payload stream in-process; otherwise it must be a
+    module-level callable so it can be pickled to the pool.
+    """
+    workers = resolve_workers(workers)
+    if workers == 1:
+        yield from func(payload for _, payload in items)
+        return
+
+    # Imported here so single-process runs (and plain imports) skip multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    items = iter(items)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = deque()
+        while True:
+            batch = list(islice(items, batch_size))
+            if not batch:
+                break
+            in_flight.append(_submit(pool, func, batch, workers))
+            # Keep the next batch queued while the current one is drained
+            if len(in_flight) > 1:
+                yield from _collect(*in_flight.popleft())
+        while in_flight:
+            yield from _collect(*in_flight.popleft())
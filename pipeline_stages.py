@@ -0,0 +1,289 @@
+"""
+Pipelined fetch → transform → write for the label pipelines.
+
+Instead of downloading a whole SPARQL result, then transforming it into a
+list, then writing the list, the three steps overlap:
+
+- stream_sparql() parses result bindings off the HTTP response as it
+  arrives, and prefetch() runs that in a background thread feeding a
+  bounded queue, so the download continues while rows are transformed;
+- the transform runs in the pipeline's main loop (with ordered_map()
+  spreading it over worker processes when --workers asks for it);
+- BackgroundWriter hands finished lines to a writer thread through
+  another bounded queue; the thread hashes the bytes as it writes them, and
+  the file only replaces the previous output if the content changed.
+
+A full queue blocks its producer, so memory is bounded by the queue sizes
+rather than by the size of the dataset.
+"""
+
+import os
+import re
+import json
+import queue
+import codecs
+import hashlib
+import threading
+
+SPARQL_ENDPOINT = "https://query.wikidata.org/sparql"
+
+# Items travel between threads in batches of DEFAULT_BATCH_SIZE, with at most
+# DEFAULT_QUEUE_SIZE batches waiting in each queue
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_QUEUE_SIZE = 16
+
+CHUNK_SIZE = 1 << 16
+
+_json_decoder = json.JSONDecoder()
+_SEPARATORS_RE = re.compile(r"[\s,]*")
+
+
+def iter_json_array(chunks, key="bindings"):
+    """Yield the objects of the first "key": [...] array of a JSON document given as text chunks.
+
+    Each object is decoded as soon as it is complete, so a large document is
+    never held in memory in full.
+    """
+    start_re = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+    chunks = iter(chunks)
+    buffer = ""
+    pos = None
+    exhausted = False
+
+    def more():
+        nonlocal buffer, exhausted
+        for chunk in chunks:
+            if chunk:
+                buffer += chunk
+                return
+        exhausted = True
+
+    while True:
+        if pos is None:
+            match = start_re.search(buffer)
+            if match:
+                pos = match.end()
+                continue
+            if exhausted:
+                raise ValueError(f'no "{key}" array in the response')
+            # Keep a tail in case the key is split across chunks
+            buffer = buffer[-256:]
+            more()
+            continue
+
+        pos = _SEPARATORS_RE.match(buffer, pos).end()
+        if pos < len(buffer) and buffer[pos] == "]":
+            return
+        try:
+            if pos == len(buffer):
+                raise json.JSONDecodeError("need more data", buffer, pos)
+            value, pos = _json_decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if exhausted:
+                raise ValueError(f'"{key}" array is truncated') from None
+            buffer, pos = buffer[pos:], 0
+            more()
+            continue
+        yield value
+
+
+def stream_sparql(query, user_agent, report=None, timeout=300, endpoint=SPARQL_ENDPOINT):
+    """Run a SPARQL query and yield its result bindings while the response downloads.
+
+    report, if given, is printed with {count} filled in once the response
+    has been read to the end.
+    """
+    import requests  # Only the fetch needs it; keeps the converters light to import
+
+    with requests.get(
+        endpoint,
+        params={"query": query, "format": "json"},
+        headers={"User-Agent": user_agent},
+        timeout=timeout,
+        stream=True,
+    ) as r:
+        r.raise_for_status()
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        chunks = (decoder.decode(chunk) for chunk in r.iter_content(chunk_size=CHUNK_SIZE))
+        count = 0
+        for binding in iter_json_array(chunks):
+            count += 1
+            yield binding
+    if report:
+        print(report.format(count=count))
+
+
+def file_digest(path):
+    """sha256 of a file's contents, or None if it doesn't exist."""
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
+
+_END = object()
+
+
+def prefetch(iterable, batch_size=DEFAULT_BATCH_SIZE, maxsize=DEFAULT_QUEUE_SIZE):
+    """Iterate over iterable in a background thread, passing items on through a bounded queue.
+
+    An exception in the producer is re-raised in the consumer. Closing the
+    returned generator early stops the producer at its next item.
+    """
+    handoff = queue.Queue(maxsize)
+    stop = threading.Event()
+    errors = []
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                handoff.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        items = iter(iterable)
+        batch = []
+        try:
+            for item in items:
+                batch.append(item)
+                if len(batch) >= batch_size:
+                    if not put(batch):
+                        return
+                    batch = []
+            if batch and not put(batch):
+                return
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            # Let a generator source release its connection when stopped early
+            close = getattr(items, "close", None)
+            if close is not None:
+                close()
+        put(_END)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            batch = handoff.get()
+            if batch is _END:
+                break
+            yield from batch
+        if errors:
+            raise errors[0]
+    finally:
+        stop.set()
+
+
+class BackgroundWriter:
+    """Text file written by a background thread that is fed through a bounded queue.
+
+    Lines go to path + ".tmp" and are hashed on the way. When the writer is
+    closed normally the temp file replaces path only if its content differs,
+    so unchanged outputs keep their old file; `changed` tells which happened.
+    If the run fails (or the with-block raises) the temp file is removed and
+    the previous output stays in place. Has a write() method, so csv writers
+    can write to it too.
+
+    before_replace, if given, is called with (path, temp path) once the new
+    content is complete, while the previous output is still there to compare.
+    """
+
+    def __init__(self, path, encoding="utf-8", newline="\n",
+                 batch_size=DEFAULT_BATCH_SIZE, maxsize=DEFAULT_QUEUE_SIZE, before_replace=None):
+        self.path = path
+        self.before_replace = before_replace
+        self.tmp_path = path + ".tmp"
+        self.digest = None
+        self.changed = None
+        # Written in binary, with the newline translation text mode would do
+        newline = os.linesep if newline is None else newline
+        self._newline = newline if newline not in ("", "\n") else None
+        self._encoder = codecs.getincrementalencoder(encoding)()
+        self._hash = hashlib.sha256()
+        self._file = open(self.tmp_path, "wb")
+        self._queue = queue.Queue(maxsize)
+        self._batch_size = batch_size
+        self._pending = []
+        self._error = None
+        self._thread = threading.Thread(target=self._drain, daemon=True)
+        self._thread.start()
+
+    def _write_bytes(self, data):
+        self._hash.update(data)
+        self._file.write(data)
+
+    def _drain(self):
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                return
+            if self._error is None:
+                try:
+                    text = "".join(batch)
+                    if self._newline:
+                        text = text.replace("\n", self._newline)
+                    self._write_bytes(self._encoder.encode(text))
+                except BaseException as e:
+                    self._error = e
+
+    def _flush(self):
+        if self._error is not None:
+            raise self._error
+        if self._pending:
+            self._queue.put(self._pending)
+            self._pending = []
+
+    def write(self, text):
+        self._pending.append(text)
+        if len(self._pending) >= self._batch_size:
+            self._flush()
+
+    def close(self, discard=False):
+        """Finish writing; replace the target if the content changed, unless discard is set or writing failed."""
+        try:
+            if not discard:
+                self._flush()
+        finally:
+            self._queue.put(None)
+            self._thread.join()
+            if self._error is None and not discard:
+                self._write_bytes(self._encoder.encode("", final=True))
+            self._file.close()
+            # Also when _flush() above re-raised the writer thread's error
+            if discard or self._error is not None:
+                os.remove(self.tmp_path)
+        if discard or self._error is not None:
+            if self._error is not None and not discard:
+                raise self._error
+            return
+        self.digest = self._hash.hexdigest()
+        if self.before_replace is not None:
+            try:
+                self.before_replace(self.path, self.tmp_path)
+            except BaseException:
+                os.remove(self.tmp_path)
+                raise
+        self.changed = file_digest(self.path) != self.digest
+        if self.changed:
+            os.replace(self.tmp_path, self.path)
+        else:
+            os.remove(self.tmp_path)
+
+    @property
+    def status(self):
+        """"updated" or "unchanged" once closed."""
+        return "updated" if self.changed else "unchanged"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(discard=exc_type is not None)
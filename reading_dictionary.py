@@ -0,0 +1,94 @@
+"""
+Kanji reading dictionary: recurring name compounds (八幡→はちまん, 日枝→ひえ)
+with the reading Wikidata's P1814 kana names give them.
+
+The index is built by build_reading_dictionary.py and stored as a sorted TSV
+(surface, reading, count). It is loaded once into a dict, and labels are
+segmented by longest match, so each compound costs one lookup. When the file
+is missing every lookup misses and callers fall back to their usual converter.
+"""
+
+import os
+import re
+from functools import lru_cache
+from tokiponizer import katakana_to_hiragana
+
+READING_DICTIONARY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reading_dictionary.tsv")
+
+# Labels are split into kanji runs (looked up) and kana runs (read as written)
+SEGMENT_RUN_RE = re.compile(r"([㐀-䶿一-鿿々]+)|([ぁ-ゖ]+)|([ァ-ヺー]+)")
+
+
+def write_reading_dictionary(entries, path=READING_DICTIONARY_PATH):
+    """Write {surface: (reading, count)} as a TSV sorted by surface."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8", newline="\n") as f:
+        f.write("surface\treading\tcount\n")
+        for surface in sorted(entries):
+            reading, count = entries[surface]
+            f.write(f"{surface}\t{reading}\t{count}\n")
+    os.replace(tmp_path, path)
+
+
+@lru_cache(maxsize=None)
+def load_reading_dictionary(path=READING_DICTIONARY_PATH):
+    """Return ({surface: reading}, longest surface length); empty if the file doesn't exist."""
+    readings = {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            next(f, None)  # Header
+            for line in f:
+                surface, reading, _count = line.rstrip("\n").split("\t")
+                readings[surface] = reading
+    except FileNotFoundError:
+        pass
+    return readings, max(map(len, readings), default=0)
+
+
+def _lookup_kanji_run(run, readings, longest):
+    """Split a kanji run into dictionary compounds by longest match, or None if a kanji isn't covered."""
+    parts = []
+    i = 0
+    while i < len(run):
+        for size in range(min(longest, len(run) - i), 0, -1):
+            reading = readings.get(run[i:i + size])
+            if reading is not None:
+                parts.append((run[i:i + size], reading))
+                i += size
+                break
+        else:
+            return None
+    return parts
+
+
+def segment_readings(text, path=READING_DICTIONARY_PATH):
+    """Segment text into [(surface, hiragana reading)] using the dictionary.
+
+    Kanji runs are split into dictionary compounds; hiragana and katakana
+    runs are their own segments. Returns None if text has a kanji the
+    dictionary doesn't cover, or anything other than kanji and kana.
+    """
+    readings, longest = load_reading_dictionary(path)
+    if not readings:
+        return None
+    segments = []
+    end = 0
+    for match in SEGMENT_RUN_RE.finditer(text):
+        if match.start() != end:
+            return None
+        end = match.end()
+        kanji, hiragana, katakana = match.groups()
+        if kanji:
+            parts = _lookup_kanji_run(kanji, readings, longest)
+            if parts is None:
+                return None
+            segments.extend(parts)
+        else:
+            segments.append((match.group(), hiragana or katakana_to_hiragana(katakana)))
+    return segments if segments and end == len(text) else None
+
+
+def lookup_reading(text, path=READING_DICTIONARY_PATH):
+    """Hiragana reading of text from the dictionary, or None if it isn't fully covered."""
+    segments = segment_readings(text, path)
+    return None if segments is None else "".join(reading for _, reading in segments)
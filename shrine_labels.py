@@ -0,0 +1,399 @@
+"""
+Run the label pipelines as one build: python -m shrine_labels run
+
+The pipelines are declared as a DAG of stages. Each stage runs its script in
+a subprocess, and stages whose dependencies are done run concurrently, up to
+--jobs at a time. The real dependencies are dictionary → ko and proposals,
+through reading_dictionary.tsv (a soft one: they run without the dictionary
+if it fails to build), and proposals → multilang, through
+proposed_indonesian_labels (.csv or .cols), so multilang is split into one stage per
+language and a full regeneration takes about as long as its longest chain.
+
+  python -m shrine_labels run                      # everything
+  python -m shrine_labels run --only ko,zh         # just these stages
+  python -m shrine_labels run --only multilang --langs ru,uk
+  python -m shrine_labels run --combined           # also all languages in one file
+  python -m shrine_labels list                     # show the stages
+
+--only runs exactly the stages named (a group like "multilang" names all of
+its languages); dependencies that are not selected are taken as already
+built. Each stage's output is printed as a block when it finishes, followed
+by a timing summary with the critical path.
+
+A stage whose code, inputs, converter versions and output options
+(--shard-size, --format) are unchanged since its last successful run (see fingerprints.py) is skipped while that run is
+younger than --max-age hours; --force runs everything regardless.
+
+With --delta, a stage that is up to date has its delta files from an
+earlier run removed: nothing was added or removed since, and an old
+.added.txt left in place could be submitted again as if it were new.
+
+Pipelines leave an output file untouched when its content comes out the
+same (see BackgroundWriter in pipeline_stages.py); the run ends by listing
+the outputs that did change.
+"""
+
+import os
+import sys
+import io
+import time
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from generate_multilang_quickstatements import ALL_LANGS
+from pipeline_stages import file_digest
+from statement_delta import DELTA_DIR
+from fingerprints import stage_fingerprint, load_fingerprints, save_fingerprints, is_up_to_date
+
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Concurrent stages; the Wikidata Query Service allows five parallel queries per IP
+DEFAULT_JOBS = 4
+
+# How long a build stays up to date when nothing local changed (Wikidata may have)
+DEFAULT_MAX_AGE_HOURS = 24
+
+# Intermediate tables are .csv or, with --format columnar, .cols; an output
+# given as a tuple is present when any one of its paths is
+TOK_TABLE = ("shrines_tokiponized.csv", "shrines_tokiponized.cols")
+PROPOSALS_TABLE = ("proposed_indonesian_labels.csv", "proposed_indonesian_labels.cols")
+READING_DICTIONARY = "reading_dictionary.tsv"
+
+
+# Options of `run` passed on to the stages' scripts
+PIPELINE_OPTIONS = ("--workers", "--delta", "--shard-size")
+# Options left out of the fingerprints: --workers doesn't change the output,
+# and the delta files of a stage that is up to date are removed instead
+UNFINGERPRINTED_OPTIONS = ("--workers", "--delta")
+TABLE_OPTIONS = (*PIPELINE_OPTIONS, "--format")
+
+
+def stage(script, args=(), after=(), inputs=(), outputs=(), packages=(),
+          options=PIPELINE_OPTIONS, optional=False, soft_after=()):
+    """A stage: script and arguments, the stages it runs after, the local files
+    it reads and writes, the converter packages whose tables it uses, and
+    which of the shared pipeline options its script takes. Optional stages
+    only run when asked for by name. Stages in soft_after are waited for too,
+    but the stage still runs if they fail (it can do without their output)."""
+    return {"script": script, "args": list(args), "after": [*after, *soft_after], "soft": list(soft_after),
+            "inputs": list(inputs), "outputs": list(outputs), "packages": list(packages),
+            "options": list(options), "optional": optional}
+
+
+LABEL_STAGES = {"tok": "tok", "ko": "ko", "zh": "zh", **{f"multilang:{lang}": lang for lang in ALL_LANGS}}
+
+
+STAGES = {
+    "dictionary": stage("build_reading_dictionary.py", outputs=[READING_DICTIONARY], options=()),
+    "tok": stage("fetch_shrines_tokiponize.py",
+                 outputs=[TOK_TABLE, "quickstatements/tok.txt"], options=TABLE_OPTIONS),
+    "ko": stage("generate_korean_quickstatements.py", soft_after=["dictionary"],
+                inputs=[READING_DICTIONARY], outputs=["quickstatements/ko.txt"], packages=["hanja"]),
+    "zh": stage("generate_chinese_quickstatements.py",
+                outputs=["quickstatements/zh.txt"], packages=["opencc-python-reimplemented"]),
+    "proposals": stage("generate_indonesian_proposals.py", soft_after=["dictionary"],
+                       inputs=[READING_DICTIONARY], outputs=[PROPOSALS_TABLE, "quickstatements/id_proposed.txt"],
+                       packages=["pykakasi"], options=TABLE_OPTIONS),
+    **{
+        f"multilang:{lang}": stage("generate_multilang_quickstatements.py", ["--langs", lang],
+                                   after=["proposals"], inputs=list(PROPOSALS_TABLE),
+                                   outputs=[f"quickstatements/{lang}.txt"])
+        for lang in ALL_LANGS
+    },
+    "combined": stage("combine_quickstatements.py", after=list(LABEL_STAGES),
+                      inputs=[f"quickstatements/{lang}.txt" for lang in LABEL_STAGES.values()],
+                      outputs=["quickstatements/combined.txt"],
+                      options=["--delta", "--shard-size"], optional=True),
+}
+
+OK, UP_TO_DATE, FAILED, SKIPPED = "ok", "up to date", "failed", "skipped"
+
+# Groups usable with --only
+GROUPS = {
+    "multilang": [name for name in STAGES if name.startswith("multilang:")],
+}
+
+
+def descendants(name):
+    """Every stage that (transitively) depends on name."""
+    found = set()
+    frontier = [name]
+    while frontier:
+        current = frontier.pop()
+        for other, spec in STAGES.items():
+            if current in spec["after"] and other not in found:
+                found.add(other)
+                frontier.append(other)
+    return found
+
+
+def select_stages(only=None, langs=None):
+    """Stage names to run, in declaration order."""
+    if only:
+        selected = set()
+        for name in only:
+            if name in GROUPS:
+                selected.update(GROUPS[name])
+            elif name in STAGES:
+                selected.add(name)
+            else:
+                raise ValueError(f"unknown stage: {name}")
+    else:
+        selected = {name for name, spec in STAGES.items() if not spec["optional"]}
+    if langs:
+        selected = {
+            name for name in selected
+            if not name.startswith("multilang:") or name.split(":", 1)[1] in langs
+        }
+    return [name for name in STAGES if name in selected]
+
+
+def pipeline_options(workers=None, delta=False, shard_size=0, table_format=None):
+    """The shared pipeline options that were given: {option: value, or None for a flag}."""
+    options = {}
+    if workers is not None:
+        options["--workers"] = str(workers)
+    if delta:
+        options["--delta"] = None
+    if shard_size:
+        options["--shard-size"] = str(shard_size)
+    if table_format and table_format != "csv":
+        # csv is the scripts' default: leaving it out keeps the fingerprints of csv builds
+        options["--format"] = table_format
+    return options
+
+
+def run_stage(name, options=None):
+    """Run one stage's script with the shared options it takes; returns (returncode, output, start, end)."""
+    spec = STAGES[name]
+    command = [sys.executable, spec["script"], *spec["args"]]
+    for option, value in (options or {}).items():
+        if option in spec["options"]:
+            command += [option] if value is None else [option, value]
+    start = time.perf_counter()
+    proc = subprocess.run(
+        command, cwd=REPO_ROOT, capture_output=True,
+        env={**os.environ, "PYTHONIOENCODING": "utf-8"},
+    )
+    end = time.perf_counter()
+    output = (proc.stdout + proc.stderr).decode("utf-8", errors="replace")
+    return proc.returncode, output, start, end
+
+
+def output_digests(name):
+    paths = [path for output in STAGES[name]["outputs"] for path in ((output,) if isinstance(output, str) else output)]
+    return {path: file_digest(os.path.join(REPO_ROOT, path)) for path in paths}
+
+
+def remove_deltas(name):
+    """Delete the delta files of a stage's QuickStatements outputs; returns the paths removed."""
+    removed = []
+    for output in STAGES[name]["outputs"]:
+        if not isinstance(output, str) or not output.startswith("quickstatements/"):
+            continue
+        base = os.path.splitext(os.path.basename(output))[0]
+        for side in ("added", "removed"):
+            path = os.path.join(REPO_ROOT, DELTA_DIR, f"{base}.{side}.txt")
+            if os.path.exists(path):
+                os.remove(path)
+                removed.append(os.path.relpath(path, REPO_ROOT).replace(os.sep, "/"))
+    return removed
+
+
+def fingerprint_of(name, options=None):
+    """The stage's fingerprint, including the options it is given that shape its outputs."""
+    spec = STAGES[name]
+    given = {
+        option: value for option, value in (options or {}).items()
+        if option in spec["options"] and option not in UNFINGERPRINTED_OPTIONS
+    }
+    return stage_fingerprint(spec["script"], spec["args"], spec["inputs"], spec["packages"], given)
+
+
+def run_dag(names, jobs=DEFAULT_JOBS, options=None, max_age=DEFAULT_MAX_AGE_HOURS * 3600, force=False):
+    """Run the named stages, respecting dependencies among them.
+
+    Returns ({name: (status, start, end)}, [changed outputs]) with status OK,
+    UP_TO_DATE (its fingerprint matched, so it didn't run), FAILED or SKIPPED
+    (a dependency failed). A stage's fingerprint is taken when it becomes ready, after the
+    stages it reads from have finished. Ready stages with more dependents are
+    started first, so the longest chain gets going as early as possible.
+    """
+    selected = set(names)
+    deps = {name: [dep for dep in STAGES[name]["after"] if dep in selected] for name in names}
+    priority = {name: -len(descendants(name)) for name in names}
+    order = {name: i for i, name in enumerate(names)}
+    pending = list(names)
+    results = {}
+    records = load_fingerprints()
+    fingerprints = {}
+    before = {}
+    changed = []
+    t0 = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        running = {}
+        while pending or running:
+            for name in list(pending):
+                if any(results[dep][0] not in (OK, UP_TO_DATE) for dep in deps[name]
+                       if dep in results and dep not in STAGES[name]["soft"]):
+                    pending.remove(name)
+                    results[name] = (SKIPPED, None, None)
+                    print(f"[{name}] skipped: a dependency failed")
+            ready = sorted(
+                (name for name in pending if all(dep in results for dep in deps[name])),
+                key=lambda name: (priority[name], order[name]),
+            )
+            fresh = False
+            for name in ready:
+                if name in fingerprints:
+                    continue
+                fingerprints[name] = fingerprint_of(name, options)
+                if not force and is_up_to_date(records.get(name), fingerprints[name], STAGES[name]["outputs"], max_age):
+                    pending.remove(name)
+                    results[name] = (UP_TO_DATE, None, None)
+                    age = (time.time() - records[name]["built_at"]) / 3600
+                    print(f"[{name}] up to date (built {age:.1f}h ago)")
+                    if "--delta" in (options or {}) and "--delta" in STAGES[name]["options"]:
+                        changed += remove_deltas(name)
+                    fresh = True
+            if fresh:
+                continue  # Their dependents may be ready now
+            for name in ready[:max(0, jobs - len(running))]:
+                pending.remove(name)
+                print(f"[{name}] started")
+                before[name] = output_digests(name)
+                running[pool.submit(run_stage, name, options)] = name
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                returncode, output, start, end = future.result()
+                status = OK if returncode == 0 else FAILED
+                results[name] = (status, start - t0, end - t0)
+                changed += [path for path, digest in output_digests(name).items() if digest != before[name][path]]
+                if status == OK:
+                    records[name] = {"fingerprint": fingerprints[name], "built_at": round(time.time())}
+                else:
+                    records.pop(name, None)
+                save_fingerprints(records)
+                print(f"\n========== [{name}] {status} in {end - start:.1f}s ==========")
+                print(output.rstrip())
+                sys.stdout.flush()
+    return results, changed
+
+
+def critical_path(results):
+    """Longest chain of completed stages by measured time: ([names], seconds)."""
+    best = {}
+
+    def chain(name):
+        if name not in best:
+            _, start, end = results[name]
+            before = max(
+                (chain(dep) for dep in STAGES[name]["after"] if dep in results and results[dep][1] is not None),
+                key=lambda item: item[1], default=([], 0.0),
+            )
+            best[name] = (before[0] + [name], before[1] + (end - start))
+        return best[name]
+
+    timed = [name for name, (_, start, _) in results.items() if start is not None]
+    return max((chain(name) for name in timed), key=lambda item: item[1], default=([], 0.0))
+
+
+def print_summary(results, wall):
+    print("\n--- Timing ---")
+    print(f"  {'stage':20s} {'status':8s} {'start':>7s} {'time':>7s}")
+    for name in (name for name in STAGES if name in results):
+        status, start, end = results[name]
+        if start is None:
+            print(f"  {name:20s} {status}")
+        else:
+            print(f"  {name:20s} {status:8s} {start:6.1f}s {end - start:6.1f}s")
+    total = sum(end - start for _, start, end in results.values() if start is not None)
+    path, length = critical_path(results)
+    print(f"  Wall clock:      {wall:.1f}s")
+    print(f"  Sum of stages:   {total:.1f}s")
+    print(f"  Critical path:   {length:.1f}s  ({' → '.join(path)})")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m shrine_labels", description="Run the shrine label pipelines.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run the pipelines as a DAG")
+    run.add_argument("--only", help="comma-separated stages or groups to run (default: all); see `list`")
+    run.add_argument("--langs", help="comma-separated multilang languages to generate (default: all)")
+    run.add_argument("--combined", action="store_true",
+                     help="also merge every language's labels into quickstatements/combined.txt, grouped by QID")
+    run.add_argument("--jobs", type=int, default=DEFAULT_JOBS,
+                     help=f"stages to run at the same time (default: {DEFAULT_JOBS})")
+    run.add_argument("--workers", type=int,
+                     help="passed on to every pipeline's --workers (default: the pipelines' own default)")
+    run.add_argument("--delta", action="store_true",
+                     help="have the pipelines also write added/removed statements against the previous "
+                          "output to quickstatements/delta/")
+    run.add_argument("--format", choices=["csv", "columnar"],
+                     help="format of the intermediate tables (shrines_tokiponized, proposed_indonesian_labels): "
+                          "csv, or columnar .cols files (default: csv)")
+    run.add_argument("--shard-size", type=int, default=0,
+                     help="have the pipelines also split their output into batches of this many statements "
+                          "in quickstatements/shards/ (default: 0, no batches)")
+    run.add_argument("--max-age", type=float, default=DEFAULT_MAX_AGE_HOURS,
+                     help="hours an unchanged stage's last build stays up to date "
+                          f"(default: {DEFAULT_MAX_AGE_HOURS}; 0 re-runs everything)")
+    run.add_argument("--force", action="store_true",
+                     help="run every selected stage even if it is up to date")
+
+    commands.add_parser("list", help="list the stages and their dependencies")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        args.only = [name.strip() for name in args.only.split(",") if name.strip()] if args.only else None
+        args.langs = [lang.strip() for lang in args.langs.split(",") if lang.strip()] if args.langs else None
+        unknown = [lang for lang in args.langs or () if lang not in ALL_LANGS]
+        if unknown:
+            parser.error(f"unknown language(s): {', '.join(unknown)} (choose from {', '.join(ALL_LANGS)})")
+        try:
+            args.stages = select_stages(args.only, args.langs)
+            if args.combined and "combined" not in args.stages:
+                args.stages.append("combined")
+        except ValueError as e:
+            parser.error(str(e))
+    return args
+
+
+def main(argv=None):
+    # Windows UTF-8 console fix
+    if hasattr(sys.stdout, 'buffer') and not isinstance(sys.stdout, io.TextIOWrapper):
+        sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    elif hasattr(sys.stdout, 'reconfigure') and sys.stdout.encoding != 'utf-8':
+        sys.stdout.reconfigure(encoding='utf-8')
+
+    args = parse_args(argv)
+    if args.command == "list":
+        for name, spec in STAGES.items():
+            after = ", ".join(f"{dep}?" if dep in spec["soft"] else dep for dep in spec["after"])
+            after = f"  (after {after})" if after else ""
+            optional = "  [optional]" if spec["optional"] else ""
+            print(f"  {name:20s} {' '.join([spec['script'], *spec['args']])}{after}{optional}")
+        print(f"  groups: {', '.join(GROUPS)}  (dep? = runs even if dep fails)")
+        return 0
+
+    print(f"Running {len(args.stages)} stage(s), up to {args.jobs} at a time...")
+    start = time.perf_counter()
+    options = pipeline_options(args.workers, args.delta, args.shard_size, args.format)
+    results, changed = run_dag(args.stages, jobs=args.jobs, options=options,
+                               max_age=args.max_age * 3600, force=args.force)
+    print_summary(results, time.perf_counter() - start)
+    print(f"\nChanged outputs: {', '.join(changed)}" if changed else "\nNo outputs changed")
+    failed = [name for name, (status, _, _) in results.items() if status not in (OK, UP_TO_DATE)]
+    if failed:
+        print(f"\nFAILED: {', '.join(failed)}")
+        return 1
+    print("\nAll stages complete! Output in quickstatements/")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
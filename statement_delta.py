@@ -0,0 +1,166 @@
+"""
+Delta between two runs of a QuickStatements file: python statement_delta.py OLD NEW
+
+Most of a month's output was already submitted or is the same as last run,
+so with --delta a pipeline also writes, for each of its files,
+
+  quickstatements/delta/<lang>.added.txt    statements new in this run
+  quickstatements/delta/<lang>.removed.txt  statements no longer generated
+
+The previous file is the output the run is about to replace. A statement is
+the QID/property/value line together with the comment lines above it; two
+statements match when their lines are equal, so a changed label shows up as
+one removal and one addition. Both files are sorted by statement with an
+external merge sort (sorted runs of at most --run-size statements, spilled to
+temporary files and merged), then walked side by side in a single merge-join:
+memory stays bounded by the run size however long the files are. Delta files
+list statements in QID order, with their comments.
+"""
+
+import os
+import sys
+import io
+import json
+import heapq
+import argparse
+import tempfile
+from itertools import islice
+from pipeline_stages import BackgroundWriter
+
+DELTA_DIR = os.path.join("quickstatements", "delta")
+
+# Statements sorted in memory at a time before a run is spilled to disk
+DEFAULT_RUN_SIZE = 20000
+
+
+def add_delta_argument(parser):
+    """Add the shared --delta option to a pipeline's argument parser."""
+    parser.add_argument(
+        "--delta", action="store_true",
+        help=f"also write <lang>.added.txt / <lang>.removed.txt against the previous output to {DELTA_DIR}/",
+    )
+
+
+def read_statements(path):
+    """Yield (statement line, comment lines above it) from a QuickStatements file; nothing if it doesn't exist."""
+    try:
+        f = open(path, encoding="utf-8")
+    except FileNotFoundError:
+        return
+    with f:
+        comments = []
+        for line in f:
+            line = line.rstrip("\n")
+            if not line.strip():
+                continue
+            if line.startswith("#"):
+                comments.append(line)
+                continue
+            yield line, tuple(comments)
+            comments = []
+
+
+def _spill(run, directory):
+    """Write one sorted run to a temporary file; returns its path."""
+    fd, path = tempfile.mkstemp(suffix=".run", dir=directory)
+    with open(fd, "w", encoding="utf-8", newline="\n") as f:
+        for statement, comments in run:
+            f.write(json.dumps([statement, comments], ensure_ascii=False) + "\n")
+    return path
+
+
+def _read_run(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            statement, comments = json.loads(line)
+            yield statement, tuple(comments)
+
+
+def sorted_statements(path, directory, run_size=DEFAULT_RUN_SIZE):
+    """Statements of a file in sorted order, spilling sorted runs into directory."""
+    statements = read_statements(path)
+    first = sorted(islice(statements, run_size))
+    if len(first) < run_size:
+        yield from first  # Fits in one run: nothing to spill
+        return
+    runs = [_spill(first, directory)]
+    del first
+    while True:
+        run = sorted(islice(statements, run_size))
+        if not run:
+            break
+        runs.append(_spill(run, directory))
+    yield from heapq.merge(*(_read_run(run) for run in runs))
+
+
+def merge_join(old, new):
+    """Walk two sorted statement streams together: yields ("added" | "removed", (statement, comments))."""
+    old, new = iter(old), iter(new)
+    a, b = next(old, None), next(new, None)
+    while a is not None or b is not None:
+        if b is None or (a is not None and a[0] < b[0]):
+            yield "removed", a
+            a = next(old, None)
+        elif a is None or b[0] < a[0]:
+            yield "added", b
+            b = next(new, None)
+        else:
+            a, b = next(old, None), next(new, None)
+
+
+def write_delta(previous_path, new_path, name, outdir=DELTA_DIR, run_size=DEFAULT_RUN_SIZE):
+    """Write <name>.added.txt and <name>.removed.txt to outdir; returns (added, removed) counts."""
+    os.makedirs(outdir, exist_ok=True)
+    counts = {"added": 0, "removed": 0}
+    with tempfile.TemporaryDirectory(prefix="delta-") as scratch, \
+            BackgroundWriter(os.path.join(outdir, f"{name}.added.txt")) as added, \
+            BackgroundWriter(os.path.join(outdir, f"{name}.removed.txt")) as removed:
+        out = {"added": added, "removed": removed}
+        joined = merge_join(sorted_statements(previous_path, scratch, run_size),
+                            sorted_statements(new_path, scratch, run_size))
+        for side, (statement, comments) in joined:
+            for comment in comments:
+                out[side].write(comment + "\n")
+            out[side].write(statement + "\n")
+            counts[side] += 1
+    return counts["added"], counts["removed"]
+
+
+def delta_callback(enabled, name, outdir=DELTA_DIR):
+    """A BackgroundWriter before_replace hook writing name's delta, or None when --delta is off."""
+    if not enabled:
+        return None
+
+    def write(previous_path, new_path):
+        added, removed = write_delta(previous_path, new_path, name, outdir)
+        print(f"Delta for {name}: {added} added, {removed} removed (in {outdir})")
+
+    return write
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Write the statements added and removed between two QuickStatements files.")
+    parser.add_argument("old", help="previous run's file")
+    parser.add_argument("new", help="this run's file")
+    parser.add_argument("--name", help="prefix for the delta files (default: the new file's name)")
+    parser.add_argument("--outdir", default=DELTA_DIR, help=f"where to write them (default: {DELTA_DIR})")
+    parser.add_argument("--run-size", type=int, default=DEFAULT_RUN_SIZE,
+                        help=f"statements sorted in memory at a time (default: {DEFAULT_RUN_SIZE})")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    # Windows UTF-8 console fix
+    if hasattr(sys.stdout, 'buffer') and not isinstance(sys.stdout, io.TextIOWrapper):
+        sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    elif hasattr(sys.stdout, 'reconfigure') and sys.stdout.encoding != 'utf-8':
+        sys.stdout.reconfigure(encoding='utf-8')
+
+    args = parse_args(argv)
+    name = args.name or os.path.splitext(os.path.basename(args.new))[0]
+    added, removed = write_delta(args.old, args.new, name, args.outdir, args.run_size)
+    print(f"{name}: {added} added, {removed} removed (in {args.outdir})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Fixed-size batches of a QuickStatements file, for pasting and retrying one at a time.
+
+With --shard-size N, a pipeline writes each of its files a second time as
+
+  quickstatements/shards/<lang>/<lang>.0001.txt, <lang>.0002.txt, ...
+  quickstatements/shards/<lang>/manifest.json
+
+in the same pass as the full file: every line the pipeline writes goes to
+the file and to the current shard, which moves on after N statements. The
+comment lines above a statement stay in its shard. The manifest lists each
+shard with its statement count, first and last QID and sha256, so a batch
+that failed to submit can be found and retried on its own.
+
+Shards are staged next to the shard directory and only moved into it once
+the run has finished; shards whose content is unchanged keep their old
+files, and shards left over from a longer previous run are removed.
+"""
+
+import os
+import json
+import shutil
+from pipeline_stages import BackgroundWriter, file_digest
+
+SHARDS_DIR = os.path.join("quickstatements", "shards")
+MANIFEST_NAME = "manifest.json"
+
+
+def add_shard_argument(parser):
+    """Add the shared --shard-size option to a pipeline's argument parser."""
+    parser.add_argument(
+        "--shard-size", type=int, default=0,
+        help=f"also split each QuickStatements file into batches of this many statements in {SHARDS_DIR}/ "
+             "(e.g. 5000; default: 0, no batches)",
+    )
+
+
+def shard_name(name, index):
+    return f"{name}.{index:04d}.txt"
+
+
+class ShardedWriter:
+    """Wraps the writer of a QuickStatements file, copying its lines into batches of shard_size statements.
+
+    Used like the writer it wraps (write, close, status); the shards and the
+    manifest are committed when it is closed without an error.
+    """
+
+    def __init__(self, writer, name, shard_size, outdir=SHARDS_DIR):
+        self.writer = writer
+        self.name = name
+        self.shard_size = shard_size
+        self.directory = os.path.join(outdir, name)
+        self.staging = self.directory + ".partial"
+        shutil.rmtree(self.staging, ignore_errors=True)
+        os.makedirs(self.staging)
+        self.shards = []
+        self._shard = None
+        self._partial = ""
+        self._comments = []
+
+    @property
+    def changed(self):
+        return self.writer.changed
+
+    @property
+    def status(self):
+        return self.writer.status
+
+    def write(self, text):
+        self.writer.write(text)
+        self._partial += text
+        if "\n" not in text:
+            return
+        *lines, self._partial = self._partial.split("\n")
+        for line in lines:
+            self._route(line + "\n")
+
+    def _route(self, line):
+        if not line.strip() or line.startswith("#"):
+            self._comments.append(line)
+            return
+        if self._shard is None or self.shards[-1]["statements"] == self.shard_size:
+            self._next_shard()
+        for comment in self._comments:
+            self._shard.write(comment)
+        self._comments = []
+        self._shard.write(line)
+        entry = self.shards[-1]
+        entry["statements"] += 1
+        qid = line.split("\t", 1)[0]
+        entry["first_qid"] = entry["first_qid"] or qid
+        entry["last_qid"] = qid
+
+    def _next_shard(self):
+        self._finish_shard()
+        filename = shard_name(self.name, len(self.shards) + 1)
+        self._shard = BackgroundWriter(os.path.join(self.staging, filename))
+        self.shards.append({"file": filename, "statements": 0, "first_qid": None, "last_qid": None})
+
+    def _finish_shard(self):
+        if self._shard is not None:
+            shard, self._shard = self._shard, None
+            shard.close()
+            self.shards[-1]["sha256"] = shard.digest
+
+    def close(self, discard=False):
+        """Finish the file and the last shard; the shards are committed unless discard is set or writing failed."""
+        writer_closing = False
+        try:
+            if not discard:
+                if self._partial:
+                    self._route(self._partial)
+                if self._comments and self._shard is not None:
+                    for comment in self._comments:
+                        self._shard.write(comment)
+                self._finish_shard()
+            if self._shard is not None:
+                self._shard.close(discard=True)
+            writer_closing = True
+            self.writer.close(discard=discard)
+        except BaseException:
+            if self._shard is not None:
+                self._shard.close(discard=True)
+            if not writer_closing:
+                self.writer.close(discard=True)
+            shutil.rmtree(self.staging, ignore_errors=True)
+            raise
+        if discard:
+            shutil.rmtree(self.staging, ignore_errors=True)
+            return
+        self._commit()
+
+    def _commit(self):
+        """Move the staged shards into place and write the manifest."""
+        os.makedirs(self.directory, exist_ok=True)
+        current = {entry["file"] for entry in self.shards}
+        for entry in self.shards:
+            staged = os.path.join(self.staging, entry["file"])
+            target = os.path.join(self.directory, entry["file"])
+            if file_digest(target) == entry["sha256"]:
+                os.remove(staged)
+            else:
+                os.replace(staged, target)
+        for filename in os.listdir(self.directory):
+            if filename.endswith(".txt") and filename not in current:
+                os.remove(os.path.join(self.directory, filename))
+        shutil.rmtree(self.staging, ignore_errors=True)
+
+        manifest = {
+            "name": self.name,
+            "source": self.writer.path.replace(os.sep, "/"),
+            "source_sha256": self.writer.digest,
+            "shard_size": self.shard_size,
+            "statements": sum(entry["statements"] for entry in self.shards),
+            "shards": self.shards,
+        }
+        with BackgroundWriter(os.path.join(self.directory, MANIFEST_NAME)) as f:
+            f.write(json.dumps(manifest, ensure_ascii=False, indent=1) + "\n")
+        print(f"Split {manifest['statements']} statements into {len(self.shards)} batch(es) in {self.directory}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(discard=exc_type is not None)
+
+
+def sharded(writer, name, shard_size, outdir=SHARDS_DIR):
+    """writer itself when shard_size is 0, otherwise a ShardedWriter around it."""
+    if not shard_size or shard_size <= 0:
+        return writer
+    return ShardedWriter(writer, name, shard_size, outdir)
@@ -1,6 +1,6 @@
 import re
 import unicodedata
-from itertools import product
+from itertools import combinations, product
 
 # ----------------------------
 # Kana → Romaji (minimal, unambiguous)
@@ -109,6 +109,17 @@ YOON_MAP = {
     "dya": "teja", "dyu": "teju", "dyo": "tejo",
 }
 
+# Morae whose romaji spelling is ambiguous, with the readings they may have
+# besides the primary one in BASE_MAP: "zu" can be ず (su) or づ (tu).
+AMBIGUOUS_MORAE = {
+    "zu": ("tu",),
+}
+
+_AMBIGUOUS_RE = re.compile("|".join(map(re.escape, AMBIGUOUS_MORAE)))
+
+# Default cap on the variants tokiponize returns for one name
+MAX_VARIANTS = 8
+
 DIPTHONGS = {
     "aa": "a", "ai": "a", "au": "a", "ae": "awe", "ao": "o",
     "ia": "ija", "ii": "i", "iu": "iju", "ie": "ije", "io": "ijo",
@@ -117,6 +128,91 @@ DIPTHONGS = {
     "oa": "owa", "oi": "owi", "ou": "o", "oe": "owe", "oo": "o",
 }
 
+# ----------------------------
+# Compiled rule chain
+# ----------------------------
+# BASE/YOON mapping and the positional h→k/p rule are folded into two token
+# tables (word-initial and elsewhere), and tokenization into one regex, so
+# tokiponize emits its output in a single left-to-right pass. DIPTHONGS is
+# applied on the fly against the last character already emitted.
+
+VOWELS = frozenset("aeiou")
+
+def _h_position(syllable: str, initial: bool) -> str:
+    """Positional h rule: word-initial h→k, elsewhere h→p."""
+    if syllable.startswith("h"):
+        return ("k" if initial else "p") + syllable[1:]
+    return syllable
+
+# YOON entries take priority over BASE ones, as in the token mapping step
+_SYLLABLES = {**BASE_MAP, **YOON_MAP}
+_INITIAL_SYLLABLES = {token: _h_position(syl, True) for token, syl in _SYLLABLES.items()}
+_MEDIAL_SYLLABLES = {token: _h_position(syl, False) for token, syl in _SYLLABLES.items()}
+
+def compile_token_regex(tokens, extra=()):
+    """Compile tokens into a trie-shaped regex that matches the longest token.
+
+    Same greedy 3/2/1 match as tokenize_romaji; finditer/findall skip
+    characters that start no token. Patterns in extra are tried last.
+    """
+    trie = {}
+    for token in tokens:
+        node = trie
+        for ch in token:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node):
+        branches, leaves = [], []
+        for ch in sorted(k for k in node if k):
+            if list(node[ch]) == [""]:
+                leaves.append(re.escape(ch))
+            else:
+                branches.append(re.escape(ch) + build(node[ch]))
+        if leaves:
+            branches.append(leaves[0] if len(leaves) == 1 else "[" + "".join(leaves) + "]")
+        pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # Greedy optional group: a longer token wins over its own prefix
+        return f"(?:{pattern})?" if "" in node else pattern
+
+    return re.compile("|".join([build(trie), *extra]))
+
+_TOKEN_RE = compile_token_regex(_SYLLABLES)
+
+def _transduce(romaji: str, choices=None) -> str:
+    """Run romaji through the compiled rule chain (uncapitalized output).
+
+    choices maps token positions to an alternative reading from
+    AMBIGUOUS_MORAE to use instead of the primary one.
+    """
+    out = ""
+    table = _INITIAL_SYLLABLES
+    for i, match in enumerate(_TOKEN_RE.finditer(romaji)):
+        if choices and i in choices:
+            syl = _h_position(choices[i], i == 0)
+        else:
+            syl = table[match.group()]
+        table = _MEDIAL_SYLLABLES
+        # Vowel after vowel: merge the pair through the diphthong table
+        if out and syl[0] in VOWELS and out[-1] in VOWELS:
+            pair = out[-1] + syl[0]
+            if pair in DIPTHONGS:
+                out = out[:-1] + DIPTHONGS[pair] + syl[1:]
+                continue
+        out += syl
+    return out
+
+def _ranked_choices(ambiguous):
+    """Lazily yield {position: reading} assignments for the ambiguous morae.
+
+    Ranked by how many alternative readings are used (the all-primary
+    reading first), then left to right — never materializing the product.
+    """
+    for k in range(len(ambiguous) + 1):
+        for picked in combinations(ambiguous, k):
+            for readings in product(*(alternatives for _, alternatives in picked)):
+                yield {pos: reading for (pos, _), reading in zip(picked, readings)}
+
 # ----------------------------
 # Core logic
 # ----------------------------
@@ -142,6 +238,9 @@ def katakana_to_hiragana(text: str) -> str:
     return "".join(result)
 
 def kana_to_romaji(text: str) -> str:
+    if text.isascii():
+        # Already romaji: nothing to look up
+        return text
     text = katakana_to_hiragana(text)
     out = ""
     i = 0
@@ -157,36 +256,6 @@ def kana_to_romaji(text: str) -> str:
             i += 1
     return out
 
-def apply_dipthongs_to_syllables(syllables: list) -> list:
-    """Apply diphthong rules to adjacent vowel endings/beginnings in syllable list."""
-    if not syllables:
-        return syllables
-
-    result = [syllables[0]]
-    for syl in syllables[1:]:
-        prev = result[-1]
-        # Check if previous syllable ends with vowel and current starts with vowel
-        if prev and syl:
-            prev_end = prev[-1] if prev[-1] in "aeiou" else None
-            curr_start = syl[0] if syl[0] in "aeiou" else None
-
-            if prev_end and curr_start:
-                pair = prev_end + curr_start
-                if pair in DIPTHONGS:
-                    # Replace the vowel ending + vowel start with diphthong result
-                    new_prev = prev[:-1] + DIPTHONGS[pair]
-                    # If current syllable was just a vowel, it's consumed
-                    if len(syl) == 1:
-                        result[-1] = new_prev
-                        continue
-                    else:
-                        # Current syllable had more after the vowel (shouldn't happen for pure vowels)
-                        result[-1] = new_prev
-                        result.append(syl[1:])
-                        continue
-        result.append(syl)
-    return result
-
 def tokenize_romaji(text: str):
     tokens = []
     i = 0
@@ -201,43 +270,52 @@ def tokenize_romaji(text: str):
             i += 1
     return tokens
 
-def apply_h_position(syllables: list) -> list:
-    """Apply positional h→k/p rule: word-initial h→k, elsewhere h→p."""
-    result = []
-    for i, syl in enumerate(syllables):
-        if syl.startswith("h"):
-            if i == 0:
-                # Word-initial: h → k
-                syl = "k" + syl[1:]
-            else:
-                # Elsewhere: h → p
-                syl = "p" + syl[1:]
-        result.append(syl)
-    return result
-
-def tokiponize(text: str):
-    text = normalize(text)
-    text = kana_to_romaji(text)
-
-    tokens = tokenize_romaji(text)
-
-    syllables = []
-    for t in tokens:
-        if t in YOON_MAP:
-            syllables.append(YOON_MAP[t])
-        elif t in BASE_MAP:
-            syllables.append(BASE_MAP[t])
-
-    # Apply positional h→k/p rule
-    syllables = apply_h_position(syllables)
-
-    # Apply diphthong rules to adjacent vowels
-    syllables = apply_dipthongs_to_syllables(syllables)
-
-    word = "".join(syllables)
-    word = word.capitalize()
-
-    return [word] if word else []
+def tokiponize_variants(text: str, max_variants=None):
+    """Lazily yield the distinct Toki Pona variants of text, best-ranked first.
+
+    At most max_variants are produced (all of them when None), so callers can
+    take the first few without expanding every ambiguous mora.
+    """
+    return _variants_normalized(normalize(text), max_variants)
+
+def _variants_normalized(text: str, max_variants):
+    romaji = kana_to_romaji(text)
+    if not _AMBIGUOUS_RE.search(romaji):
+        # Common case: a single reading, no ranking needed
+        word = _transduce(romaji).capitalize()
+        if word and max_variants != 0:
+            yield word
+        return
+    ambiguous = [
+        (i, AMBIGUOUS_MORAE[match.group()])
+        for i, match in enumerate(_TOKEN_RE.finditer(romaji))
+        if match.group() in AMBIGUOUS_MORAE
+    ]
+    seen = set()
+    for choices in _ranked_choices(ambiguous):
+        if max_variants is not None and len(seen) >= max_variants:
+            return
+        word = _transduce(romaji, choices).capitalize()
+        if word and word not in seen:
+            seen.add(word)
+            yield word
+
+def tokiponize(text: str, max_variants=MAX_VARIANTS):
+    return list(tokiponize_variants(text, max_variants))
+
+def tokiponize_many(texts, max_variants=MAX_VARIANTS):
+    """Tokiponize an iterable of names, yielding one variant list per input.
+
+    Inputs are grouped by their normalized form so each distinct name is
+    converted only once; results are streamed back in input order.
+    """
+    cache = {}
+    for text in texts:
+        key = normalize(text)
+        variants = cache.get(key)
+        if variants is None:
+            variants = cache[key] = list(_variants_normalized(key, max_variants))
+        yield list(variants)
 
 # ----------------------------
 # Example
@@ -246,4 +324,5 @@ def tokiponize(text: str):
 if __name__ == "__main__":
     print(tokiponize("Hachiman"))
     print(tokiponize("じづ"))
+    print(tokiponize("Izumo"))
     print(tokiponize("トヨタマヒメ"))
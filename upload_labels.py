@@ -0,0 +1,353 @@
+"""
+Upload the generated labels to Wikidata directly, one edit per item.
+
+  python upload_labels.py --dry-run                     # what would be edited
+  python upload_labels.py                               # every label language
+  python upload_labels.py quickstatements/ko.txt quickstatements/zh.txt
+  python upload_labels.py --api-url http://localhost:8765/w/api.php   # stand-in server
+
+The statement files are merged by QID (see combine_quickstatements.py), and
+all of an item's labels go into one wbeditentity call instead of one edit per
+language. Edits run --concurrency at a time and are sent with maxlag: when
+the servers report replication lag, the edit waits as long as they ask and
+is sent again; connection errors, HTTP 429 and 5xx are retried with
+exponential backoff.
+
+Every finished item is appended to a ledger (upload_ledger.jsonl), flushed
+to disk straight away. Items already recorded as done with the same labels
+are skipped, so an interrupted upload resumes where it stopped; failed items
+are tried again on the next run.
+
+Log in with a bot password (Special:BotPasswords) given in the
+WIKIDATA_USERNAME and WIKIDATA_PASSWORD environment variables.
+wikibase_stand_in.py serves a local imitation of the API for trying the
+uploader out, including lag and server errors.
+"""
+
+import os
+import sys
+import io
+import re
+import json
+import time
+import random
+import hashlib
+import argparse
+import tempfile
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from combine_quickstatements import QS_DIR, DEFAULT_LANGS, combined_statements
+from statement_delta import DEFAULT_RUN_SIZE
+
+DEFAULT_API_URL = "https://www.wikidata.org/w/api.php"
+USER_AGENT = "Japanese-Tokiponizer/1.0 (label uploader)"
+LEDGER_PATH = "upload_ledger.jsonl"
+SUMMARY = "Add transliterated labels for a Japanese shrine/temple (shinto-label-generator)"
+
+# Wikimedia asks bots to edit serially; a couple of connections hide the round trips
+DEFAULT_CONCURRENCY = 2
+# Seconds of replication lag above which the servers refuse the edit
+DEFAULT_MAXLAG = 5
+DEFAULT_RETRIES = 5
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 120.0
+
+STATEMENT_RE = re.compile(r'^(Q\d+)\tL([a-z][a-z0-9-]*)\t"(.*)"$')
+
+
+def parse_statement(statement):
+    """(qid, lang, label) of a QuickStatements label line, or None for any other command."""
+    match = STATEMENT_RE.match(statement)
+    if not match:
+        return None
+    qid, lang, value = match.groups()
+    return qid, lang, value.replace('""', '"')
+
+
+def item_labels(paths, scratch, run_size=DEFAULT_RUN_SIZE):
+    """Yield (qid, {lang: label}) for every item in the files, in QID order."""
+    for qid, group in combined_statements(paths, scratch, run_size):
+        labels = {}
+        for statement, _ in group:
+            parsed = parse_statement(statement)
+            if parsed is None:
+                print(f"Warning: not a label statement, ignored: {statement}")
+                continue
+            _, lang, label = parsed
+            labels.setdefault(lang, label)
+        if labels:
+            yield qid, labels
+
+
+def edit_key(qid, labels):
+    """Identifies one item's edit in the ledger: the QID and a hash of its labels."""
+    encoded = json.dumps(labels, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    return f"{qid}:{hashlib.sha256(encoded).hexdigest()[:16]}"
+
+
+class Ledger:
+    """Append-only record of finished edits, one JSON object per line."""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # A line cut short by a crash
+                    if entry.get("status") == "done":
+                        self.done.add(entry["key"])
+        except FileNotFoundError:
+            pass
+        self._file = open(path, "a", encoding="utf-8", newline="\n")
+
+    def record(self, key, status, **info):
+        entry = {"key": key, "status": status, "time": round(time.time()), **info}
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        if status == "done":
+            self.done.add(key)
+
+    def close(self):
+        self._file.close()
+
+
+class ApiError(Exception):
+    """An error the API returned for a request that retrying won't fix."""
+
+    def __init__(self, code, info=""):
+        super().__init__(f"{code}: {info}" if info else code)
+        self.code = code
+
+
+class WikibaseClient:
+    """Minimal client for the MediaWiki action API: bot-password login and label edits."""
+
+    def __init__(self, api_url=DEFAULT_API_URL, maxlag=DEFAULT_MAXLAG, retries=DEFAULT_RETRIES,
+                 user_agent=USER_AGENT, sleep=time.sleep):
+        import requests  # Only uploading needs it; --dry-run works without
+
+        self.requests = requests
+        self.api_url = api_url
+        self.maxlag = maxlag
+        self.retries = retries
+        self.user_agent = user_agent
+        self.sleep = sleep
+        self.cookies = requests.cookies.RequestsCookieJar()
+        self.csrf_token = None
+        self._local = threading.local()
+        self._token_lock = threading.Lock()
+
+    def _session(self):
+        """A session per thread, all sharing the login cookies."""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self.requests.Session()
+            session.headers["User-Agent"] = self.user_agent
+            session.cookies = self.cookies
+            self._local.session = session
+        return session
+
+    def _backoff(self, attempt):
+        delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+        self.sleep(delay * random.uniform(0.5, 1.0))
+
+    def call(self, params, post=False):
+        """One API request, retried on lag, throttling and server errors; returns the decoded response."""
+        params = {**params, "format": "json", "formatversion": 2}
+        if self.maxlag is not None:
+            params["maxlag"] = self.maxlag
+        attempt = 0
+        while True:
+            try:
+                if post:
+                    r = self._session().post(self.api_url, data=params, timeout=60)
+                else:
+                    r = self._session().get(self.api_url, params=params, timeout=60)
+            except self.requests.RequestException as e:
+                if attempt >= self.retries:
+                    raise ApiError("http", str(e)) from e
+                self._backoff(attempt)
+                attempt += 1
+                continue
+
+            if r.status_code == 429 or r.status_code >= 500:
+                if attempt >= self.retries:
+                    raise ApiError("http", f"HTTP {r.status_code}")
+                retry_after = r.headers.get("Retry-After")
+                if retry_after and retry_after.isdigit():
+                    self.sleep(int(retry_after))
+                else:
+                    self._backoff(attempt)
+                attempt += 1
+                continue
+            if r.status_code >= 400:
+                raise ApiError("http", f"HTTP {r.status_code}")
+            try:
+                result = r.json()
+            except ValueError:
+                raise ApiError("badresponse", "the response is not JSON") from None
+            error = result.get("error")
+            if not error:
+                return result
+            code = error.get("code", "unknown")
+            if code == "maxlag":
+                # Lag isn't a failure of the edit: wait as asked, without using up retries
+                self.sleep(int(r.headers.get("Retry-After", self.maxlag or DEFAULT_MAXLAG)))
+                continue
+            if code == "badtoken" and "token" in params and attempt < self.retries:
+                params["token"] = self.refresh_csrf_token(params["token"])
+                attempt += 1
+                continue
+            raise ApiError(code, error.get("info", ""))
+
+    def login(self, username, password):
+        token = self.call({"action": "query", "meta": "tokens", "type": "login"})["query"]["tokens"]["logintoken"]
+        result = self.call({"action": "login", "lgname": username, "lgpassword": password, "lgtoken": token},
+                           post=True)["login"]
+        if result.get("result") != "Success":
+            raise ApiError("login", result.get("reason", result.get("result", "")))
+        self.refresh_csrf_token()
+
+    def refresh_csrf_token(self, stale=None):
+        """Fetch a new CSRF token, unless another thread already replaced the stale one."""
+        with self._token_lock:
+            if self.csrf_token is None or self.csrf_token == stale:
+                self.csrf_token = self.call({"action": "query", "meta": "tokens"})["query"]["tokens"]["csrftoken"]
+            return self.csrf_token
+
+    def edit_labels(self, qid, labels, summary=SUMMARY):
+        """Set several labels of one item in a single edit; returns the new revision id."""
+        data = {"labels": {lang: {"language": lang, "value": label} for lang, label in labels.items()}}
+        result = self.call({
+            "action": "wbeditentity",
+            "id": qid,
+            "data": json.dumps(data, ensure_ascii=False),
+            "summary": summary,
+            "bot": 1,
+            "assert": "user",
+            "token": self.csrf_token,
+        }, post=True)
+        return result.get("entity", {}).get("lastrevid")
+
+
+def upload(client, items, ledger, concurrency=DEFAULT_CONCURRENCY, summary=SUMMARY, report_every=100):
+    """Submit each (qid, labels) not yet in the ledger, at most concurrency at a time; returns a Counter of outcomes."""
+    outcomes = Counter()
+    running = {}
+
+    def finish(done):
+        for future in done:
+            qid, labels, key = running.pop(future)
+            try:
+                revid = future.result()
+            except ApiError as e:
+                ledger.record(key, "failed", qid=qid, error=str(e))
+                outcomes["failed"] += 1
+                print(f"  {qid}: failed ({e})")
+            else:
+                ledger.record(key, "done", qid=qid, labels=len(labels), revid=revid)
+                outcomes["done"] += 1
+            finished = outcomes["done"] + outcomes["failed"]
+            if finished % report_every == 0:
+                print(f"  {finished} items: {outcomes['done']} edited, {outcomes['failed']} failed")
+                sys.stdout.flush()
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        for qid, labels in items:
+            key = edit_key(qid, labels)
+            if key in ledger.done:
+                outcomes["already done"] += 1
+                continue
+            if len(running) >= concurrency:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                finish(done)
+            running[pool.submit(client.edit_labels, qid, labels, summary)] = (qid, labels, key)
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            finish(done)
+    return outcomes
+
+
+def dry_run(items, ledger):
+    """Count the edits an upload would make; returns a Counter."""
+    counts = Counter()
+    languages = Counter()
+    for qid, labels in items:
+        if edit_key(qid, labels) in ledger.done:
+            counts["already done"] += 1
+            continue
+        counts["edits"] += 1
+        counts["labels"] += len(labels)
+        languages.update(labels.keys())
+    print(f"Would make {counts['edits']} edits setting {counts['labels']} labels "
+          f"({counts['already done']} items already done according to {ledger.path})")
+    for lang, count in languages.most_common():
+        print(f"  {lang:4s} {count}")
+    return counts
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Upload generated labels to Wikidata, one wbeditentity edit per item.")
+    parser.add_argument("files", nargs="*",
+                        help="QuickStatements files to upload (default: every label language in quickstatements/)")
+    parser.add_argument("--api-url", default=DEFAULT_API_URL, help=f"MediaWiki API endpoint (default: {DEFAULT_API_URL})")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help=f"edits in flight at a time (default: {DEFAULT_CONCURRENCY})")
+    parser.add_argument("--maxlag", type=int, default=DEFAULT_MAXLAG,
+                        help=f"maxlag sent with every request, in seconds (default: {DEFAULT_MAXLAG})")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES,
+                        help=f"retries after a connection or server error (default: {DEFAULT_RETRIES})")
+    parser.add_argument("--ledger", default=LEDGER_PATH, help=f"progress ledger (default: {LEDGER_PATH})")
+    parser.add_argument("--summary", default=SUMMARY, help="edit summary")
+    parser.add_argument("--limit", type=int, help="stop after this many items")
+    parser.add_argument("--dry-run", action="store_true", help="only count the edits that would be made")
+    args = parser.parse_args(argv)
+    if not args.files:
+        args.files = [path for path in (os.path.join(QS_DIR, f"{lang}.txt") for lang in DEFAULT_LANGS)
+                      if os.path.exists(path)]
+    return args
+
+
+def main(argv=None):
+    # Windows UTF-8 console fix
+    if hasattr(sys.stdout, 'buffer') and not isinstance(sys.stdout, io.TextIOWrapper):
+        sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    elif hasattr(sys.stdout, 'reconfigure') and sys.stdout.encoding != 'utf-8':
+        sys.stdout.reconfigure(encoding='utf-8')
+
+    args = parse_args(argv)
+    ledger = Ledger(args.ledger)
+    try:
+        with tempfile.TemporaryDirectory(prefix="upload-") as scratch:
+            items = item_labels(args.files, scratch)
+            if args.limit is not None:
+                items = (item for _, item in zip(range(args.limit), items))
+            if args.dry_run:
+                dry_run(items, ledger)
+                return 0
+
+            username = os.environ.get("WIKIDATA_USERNAME")
+            password = os.environ.get("WIKIDATA_PASSWORD")
+            if not username or not password:
+                print("Set WIKIDATA_USERNAME and WIKIDATA_PASSWORD (a bot password) to upload.")
+                return 1
+            client = WikibaseClient(args.api_url, args.maxlag, args.retries)
+            client.login(username, password)
+            print(f"Logged in to {args.api_url} as {username}; uploading {len(args.files)} file(s)...")
+            outcomes = upload(client, items, ledger, args.concurrency, args.summary)
+    finally:
+        ledger.close()
+
+    print(f"\nDone! {outcomes['done']} items edited, {outcomes['failed']} failed, "
+          f"{outcomes['already done']} already done (ledger: {args.ledger})")
+    return 1 if outcomes["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
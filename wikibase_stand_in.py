@@ -0,0 +1,156 @@
+"""
+Local stand-in for the parts of the Wikidata API that upload_labels.py uses.
+
+  python wikibase_stand_in.py --port 8765 --lag-every 7 --error-every 11
+  WIKIDATA_USERNAME=test WIKIDATA_PASSWORD=test \\
+      python upload_labels.py --api-url http://localhost:8765/w/api.php
+
+Answers login and CSRF token queries, and applies wbeditentity label edits to
+entities kept in memory. --lag-every N reports replication lag above the
+request's maxlag on every Nth edit (with Retry-After, as the real servers
+do), --error-every N answers every Nth edit with HTTP 503, and --fail-qids
+rejects edits to the given items with an API error. On exit (Ctrl+C or
+SIGTERM) the edits are summarized and, with --dump, the resulting labels
+are written as JSON.
+"""
+
+import sys
+import io
+import json
+import signal
+import argparse
+import threading
+from collections import Counter, defaultdict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qsl
+
+LOGIN_TOKEN = "stand-in-login+\\"
+CSRF_TOKEN = "stand-in-csrf+\\"
+SIMULATED_LAG = 10
+
+
+class StandInApi:
+    """In-memory Wikibase: labels per entity, plus counters for the simulated faults."""
+
+    def __init__(self, lag_every=0, error_every=0, fail_qids=()):
+        self.lag_every = lag_every
+        self.error_every = error_every
+        self.fail_qids = set(fail_qids)
+        self.labels = defaultdict(dict)
+        self.counts = Counter()
+        self.revision = 0
+        self.lock = threading.Lock()
+
+    def handle(self, params):
+        """Returns (HTTP status, extra headers, response body)."""
+        action = params.get("action")
+        if action == "query" and params.get("meta") == "tokens":
+            if params.get("type") == "login":
+                return 200, {}, {"query": {"tokens": {"logintoken": LOGIN_TOKEN}}}
+            return 200, {}, {"query": {"tokens": {"csrftoken": CSRF_TOKEN}}}
+        if action == "login":
+            if params.get("lgtoken") != LOGIN_TOKEN:
+                return 200, {}, {"login": {"result": "WrongToken"}}
+            return 200, {}, {"login": {"result": "Success", "lgusername": params.get("lgname")}}
+        if action == "wbeditentity":
+            return self.edit(params)
+        return 200, {}, {"error": {"code": "badvalue", "info": f"Unsupported action: {action}"}}
+
+    def edit(self, params):
+        with self.lock:
+            self.counts["requests"] += 1
+            n = self.counts["requests"]
+            maxlag = params.get("maxlag")
+            if self.lag_every and n % self.lag_every == 0 and maxlag and SIMULATED_LAG > int(maxlag):
+                self.counts["maxlag"] += 1
+                return 200, {"Retry-After": "1"}, {"error": {
+                    "code": "maxlag", "info": f"Waiting for a database server: {SIMULATED_LAG} seconds lagged.",
+                    "lag": SIMULATED_LAG}}
+            if self.error_every and n % self.error_every == 0:
+                self.counts["server errors"] += 1
+                return 503, {}, {}
+            if params.get("token") != CSRF_TOKEN:
+                return 200, {}, {"error": {"code": "badtoken", "info": "Invalid CSRF token."}}
+            qid = params.get("id")
+            if qid in self.fail_qids:
+                self.counts["rejected"] += 1
+                return 200, {}, {"error": {"code": "modification-failed", "info": f"Stand-in rejects {qid}."}}
+            data = json.loads(params.get("data", "{}"))
+            for lang, label in data.get("labels", {}).items():
+                self.labels[qid][lang] = label["value"]
+                self.counts["labels"] += 1
+            self.counts["edits"] += 1
+            self.revision += 1
+            return 200, {}, {"success": 1, "entity": {"id": qid, "lastrevid": self.revision}}
+
+
+def make_handler(api):
+    class Handler(BaseHTTPRequestHandler):
+        def respond(self, params):
+            status, headers, body = api.handle(params)
+            payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            self.respond(dict(parse_qsl(urlsplit(self.path).query)))
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length).decode("utf-8")
+            self.respond({**dict(parse_qsl(urlsplit(self.path).query)), **dict(parse_qsl(body))})
+
+        def log_message(self, format, *args):
+            pass  # Thousands of edits; the summary on exit says what happened
+
+    return Handler
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in for the Wikidata API, for testing upload_labels.py.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--lag-every", type=int, default=0, help="report maxlag on every Nth edit (default: never)")
+    parser.add_argument("--error-every", type=int, default=0, help="answer every Nth edit with HTTP 503 (default: never)")
+    parser.add_argument("--fail-qids", default="", help="comma-separated items whose edits are rejected")
+    parser.add_argument("--dump", help="write the labels set during the run to this JSON file on exit")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    # Windows UTF-8 console fix
+    if hasattr(sys.stdout, 'buffer') and not isinstance(sys.stdout, io.TextIOWrapper):
+        sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    elif hasattr(sys.stdout, 'reconfigure') and sys.stdout.encoding != 'utf-8':
+        sys.stdout.reconfigure(encoding='utf-8')
+
+    args = parse_args(argv)
+    fail_qids = [qid.strip() for qid in args.fail_qids.split(",") if qid.strip()]
+    api = StandInApi(args.lag_every, args.error_every, fail_qids)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(api))
+    # Stopped from a script with kill: exit the same way as on Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    print(f"Stand-in API at http://localhost:{args.port}/w/api.php (Ctrl+C to stop)")
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+    print("\n--- Stand-in summary ---")
+    for name in ("requests", "edits", "labels", "maxlag", "server errors", "rejected"):
+        print(f"  {name:14s} {api.counts[name]}")
+    if args.dump:
+        with open(args.dump, "w", encoding="utf-8", newline="\n") as f:
+            json.dump(api.labels, f, ensure_ascii=False, indent=1, sort_keys=True)
+        print(f"  Labels written to {args.dump}")
+
+
+if __name__ == "__main__":
+    main()